@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+# Benchmarks do motor, da busca e do treino do Kamisado.
+#
+# Uso:
+#   python benchmark_kamisado.py --output bench.json
+#   python benchmark_kamisado.py --output novo.json --baseline bench.json --threshold 0.25
+#
+# Cada resultado vai para o JSON com a unidade e o sentido (maior ou menor é
+# melhor). Com --baseline, sai com código 1 se algum resultado piorar mais que
+# threshold em relação ao arquivo de referência. Os tempos são o melhor de
+# --repeat medidas; as posições e as sementes são fixas.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import ep3_kamisado_entrega as kam
+
+BENCHMARK_VERSION = 1
+DEFAULT_THRESHOLD = 0.25
+
+def benchmark_positions(n_games=40, seed=1234):
+    # Estados em dicionário das partidas aleatórias (fixas pela semente), sem os terminais
+    rng = random.Random(seed)
+    positions = []
+    for i in range(n_games):
+        state = kam.initial_state()
+        if i % 2:
+            state['turn'] = 'black'
+        while not kam.game_over(state):
+            moves = kam.successors(state)
+            if not moves:
+                break
+            positions.append(state)
+            state = rng.choice(moves)
+    return positions
+
+def best_time(fn, repeat, min_time=0.2):
+    # Tempo por chamada de fn(): o melhor de repeat medidas, cada uma com
+    # chamadas suficientes para durar min_time; devolve também o valor de fn()
+    number, result = 1, None
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            result = fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best, result
+
+def metric(value, unit, higher_is_better=True):
+    return {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+def bench_movegen(results, positions, repeat):
+    def run():
+        return sum(len(kam.successors(state)) for state in positions)
+    elapsed, nodes = best_time(run, repeat)
+    results['successors.nodes_per_sec'] = metric(nodes / elapsed, 'nodes/s')
+
+def bench_heuristic(results, positions, repeat):
+    elapsed, _ = best_time(lambda: [kam.advanced_heuristic(state) for state in positions], repeat)
+    results['advanced_heuristic.evals_per_sec'] = metric(len(positions) / elapsed, 'evals/s')
+
+def bench_minimax(results, positions, depths, repeat):
+    # Busca de cada posição com um agente zerado, como numa primeira jogada
+    agent = kam.MinimaxAgent()
+    search_positions = [kam.Position.from_dict(state) for state in positions[::max(1, len(positions) // 12)]]
+    for depth in depths:
+        agent.depth = depth
+        def run():
+            elapsed, nodes = 0.0, 0
+            for pos in search_positions:
+                agent.reset() # Fora da medida: só limpa as tabelas
+                start = time.perf_counter()
+                _, _, ctx = agent.search_position(pos)
+                elapsed += time.perf_counter() - start
+                nodes += ctx.nodes
+            return elapsed, nodes
+        elapsed, nodes = min(run() for _ in range(repeat))
+        results[f'minimax.depth{depth}.nodes'] = metric(nodes, 'nodes', higher_is_better=False)
+        results[f'minimax.depth{depth}.time_ms'] = metric(elapsed * 1000, 'ms', higher_is_better=False)
+        results[f'minimax.depth{depth}.nodes_per_sec'] = metric(nodes / elapsed, 'nodes/s')
+
+def parallel_worker_counts():
+    # 2, 4, 8... até o número de núcleos, e o próprio número de núcleos
+    cores = max(2, os.cpu_count() or 1)
+    return sorted({2 ** k for k in range(1, cores.bit_length()) if 2 ** k <= cores} | {cores})
+
+def bench_parallel_minimax(results, positions, depth, worker_counts):
+    # Busca paralela pela raiz com cada número de processos contra a serial de
+    # um agente zerado: tempo, speedup e quantos movimentos escolhidos diferem
+    # (devem ser todos iguais). O pool é criado fora da medida
+    search_positions = [kam.Position.from_dict(state) for state in positions[::max(1, len(positions) // 12)]]
+    serial = kam.MinimaxAgent(depth)
+    serial_time, serial_moves = 0.0, []
+    for pos in search_positions:
+        serial.reset()
+        start = time.perf_counter()
+        serial_moves.append(serial.search_position(pos)[1])
+        serial_time += time.perf_counter() - start
+    for workers in worker_counts:
+        agent = kam.MinimaxAgent(depth, workers=workers)
+        agent.start_pool()
+        elapsed, mismatches = 0.0, 0
+        for pos, serial_move in zip(search_positions, serial_moves):
+            start = time.perf_counter()
+            _, move, _ = agent.search_position(pos)
+            elapsed += time.perf_counter() - start
+            mismatches += move != serial_move
+        agent.close()
+        prefix = f'minimax_parallel.depth{depth}.workers{workers}'
+        results[f'{prefix}.time_ms'] = metric(elapsed * 1000, 'ms', higher_is_better=False)
+        results[f'{prefix}.speedup'] = metric(serial_time / elapsed, 'x')
+        results[f'{prefix}.mismatches'] = metric(mismatches, 'moves', higher_is_better=False)
+
+def bench_mcts(results, positions, playouts, repeat):
+    # Simulações por segundo, cada busca numa árvore nova
+    agent = kam.MCTSAgent(playouts, seed=3)
+    search_positions = [kam.Position.from_dict(state) for state in positions[::max(1, len(positions) // 6)]]
+    def run():
+        for pos in search_positions:
+            agent.reset()
+            agent._search(pos)
+    elapsed, _ = best_time(run, repeat, min_time=0)
+    results['mcts.playouts_per_sec'] = metric(playouts * len(search_positions) / elapsed, 'playouts/s')
+
+def bench_q_agent(results, positions, repeat):
+    # Q-table preenchida com metade das ações das posições de teste
+    rng = random.Random(99)
+    agent = kam.QLearningAgent(kam.ALPHA, kam.GAMMA, 0.0, saver=False)
+    agent.training_mode = False
+    samples = []
+    for state in positions:
+        moves = kam.successors(state)
+        for move in moves:
+            if rng.random() < 0.5:
+                agent.q_table[agent.key(kam.encode_state_key(state), kam.action_code(state, move))] = rng.random()
+        action = rng.choice(moves)
+        samples.append((state, moves, action, kam.successors(action)))
+
+    def choose():
+        for state, moves, _, _ in samples:
+            agent._q_cache = None # Cada escolha consulta a tabela
+            agent.choose_action(state, moves)
+    elapsed, _ = best_time(choose, repeat)
+    results['q_agent.choose_action_per_sec'] = metric(len(samples) / elapsed, 'ops/s')
+
+    def update():
+        for state, _, action, next_moves in samples:
+            agent.update(state, action, 0.5, action, next_moves)
+    elapsed, _ = best_time(update, repeat)
+    results['q_agent.update_per_sec'] = metric(len(samples) / elapsed, 'ops/s')
+
+def bench_training(results, episodes, minimax_depth, repeat):
+    # Episódios dos dois laços de treino com sementes fixas, sem salvar
+    def minimax_run():
+        random.seed(7)
+        agent = kam.QLearningAgent(kam.ALPHA, kam.GAMMA, 0.3, saver=False)
+        minimax = kam.MinimaxAgent(minimax_depth)
+        for _ in range(episodes):
+            kam.play_minimax_episode(agent, minimax)
+    elapsed, _ = best_time(minimax_run, repeat)
+    results[f'train.minimax_depth{minimax_depth}.episodes_per_sec'] = metric(episodes / elapsed, 'episodes/s')
+
+    def self_play_run():
+        random.seed(7)
+        agent = kam.QLearningAgent(kam.ALPHA, kam.GAMMA, 0.3, saver=False)
+        for _ in range(episodes):
+            kam.play_self_play_episode(agent)
+            agent.decay_epsilon()
+    elapsed, _ = best_time(self_play_run, repeat)
+    results['train.self_play.episodes_per_sec'] = metric(episodes / elapsed, 'episodes/s')
+
+def bench_persistence(results, sizes, repeat):
+    # save/load do agente com Q-tables aleatórias de cada tamanho; memória de
+    # pico medida com tracemalloc (os arrays NumPy são contabilizados)
+    rng = np.random.default_rng(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        fn = os.path.join(tmp, 'bench.kqt')
+        for size in sizes:
+            agent = kam.QLearningAgent(kam.ALPHA, kam.GAMMA, 0.0, saver=False)
+            w = np.unique(rng.integers(0, 1 << 63, size, dtype=np.uint64)) # Chaves distintas
+            x = rng.integers(0, 1 << 17, len(w), dtype=np.uint32)
+            agent.q_table = kam.QTable.from_arrays(w, w ^ np.uint64(0xFF), x, rng.random(len(w)))
+            for label, fn_call in (('save', lambda: agent.save(fn)),
+                                   ('load', lambda: agent.load(fn)),
+                                   ('load_mmap', lambda: agent.load(fn, mmap=True))):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed, _ = best_time(fn_call, repeat)
+                    tracemalloc.start()
+                    fn_call()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                results[f'q_table.{size}.{label}_ms'] = metric(elapsed * 1000, 'ms', higher_is_better=False)
+                results[f'q_table.{size}.{label}_peak_mb'] = metric(peak / 2**20, 'MB', higher_is_better=False)
+            results[f'q_table.{size}.file_mb'] = metric(os.path.getsize(fn) / 2**20, 'MB', higher_is_better=False)
+
+def run_benchmarks(quick=False, repeat=3):
+    positions = benchmark_positions(15 if quick else 40)
+    results = {}
+    steps = [
+        ('geração de movimentos', lambda: bench_movegen(results, positions, repeat)),
+        ('heurística', lambda: bench_heuristic(results, positions, repeat)),
+        ('minimax', lambda: bench_minimax(results, positions, (1, 2, 3) if quick else (1, 2, 3, 4), repeat)),
+        ('minimax paralelo', lambda: bench_parallel_minimax(results, positions, 4 if quick else 5,
+                                                            parallel_worker_counts())),
+        ('mcts', lambda: bench_mcts(results, positions, 500 if quick else 2000, repeat)),
+        ('Q-agent', lambda: bench_q_agent(results, positions, repeat)),
+        ('treino', lambda: bench_training(results, 50 if quick else 200, 2, repeat)),
+        ('save/load', lambda: bench_persistence(results, (10_000, 100_000) if quick else (10_000, 100_000, 1_000_000), repeat)),
+    ]
+    for label, step in steps:
+        start = time.perf_counter()
+        step()
+        print(f"⏱️ {label}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return {
+        'version': BENCHMARK_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'quick': quick,
+        'repeat': repeat,
+        'results': results,
+    }
+
+def compare_results(current, baseline, threshold=DEFAULT_THRESHOLD):
+    # Resultados presentes nos dois arquivos que pioraram mais que threshold.
+    # Com referência 0, não há piora relativa: um resultado "menor é melhor" é
+    # comparado pelo valor absoluto (piora = o próprio valor)
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        if not old['value']:
+            if not result['higher_is_better'] and result['value'] > threshold:
+                regressions.append((name, old['value'], result['value'], result['value']))
+            continue
+        change = result['value'] / old['value'] - 1
+        worse = -change if result['higher_is_better'] else change
+        if worse > threshold:
+            regressions.append((name, old['value'], result['value'], worse))
+    return regressions
+
+def correctness_failures(report):
+    # Resultados que têm de ser 0 em qualquer execução (movimentos da busca
+    # paralela diferentes dos da serial), com ou sem --baseline
+    return [(name, result['value']) for name, result in report['results'].items()
+            if name.endswith('.mismatches') and result['value']]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do Kamisado")
+    parser.add_argument('--output', default='-', help="arquivo JSON de saída ('-' para a saída padrão)")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparar")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="piora relativa tolerada antes de acusar regressão (0.25 = 25%%)")
+    parser.add_argument('--repeat', type=int, default=3, help="medidas de cada resultado (vale a melhor)")
+    parser.add_argument('--quick', action='store_true', help="tamanhos menores, para conferência rápida")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.quick, args.repeat)
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+    for name, result in sorted(report['results'].items()):
+        print(f"{name:45s} {result['value']:14.2f} {result['unit']}", file=sys.stderr)
+
+    failures = correctness_failures(report)
+    for name, value in failures:
+        print(f"❌ {name}: {value:.0f} (deveria ser 0)", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        for name, old, new, worse in regressions:
+            amount = f"{worse:.0%} pior" if old else f"{worse:.2f} acima de 0"
+            print(f"❌ Regressão em {name}: {old:.2f} -> {new:.2f} ({amount})", file=sys.stderr)
+        if regressions or failures:
+            return 1
+        print(f"✅ Nenhuma regressão acima de {args.threshold:.0%}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,13 +8,18 @@ Original file is located at
 """
 
 import numpy as np
-from copy import deepcopy
 import random
-import math
 import pickle
 import os
+import json
+import csv
+import struct
 import threading
 import time
+import multiprocessing
+from collections import deque
+import argparse
+import sys
 
 # ---------- CONFIGURÁVEIS ----------
 EPISODES = 5000 # Constante global de referência
@@ -23,10 +28,23 @@ GAMMA = 0.9
 EPSILON_START = 1.0
 EPSILON_MIN = 0.15
 EPSILON_DECAY = 0.999
-PICKLE_FILE = 'kamisado_q_table.pkl'
+PICKLE_FILE = 'kamisado_q_table.pkl' # Formato antigo (pickle), convertido ao carregar
+Q_TABLE_FILE = 'kamisado_q_table.kqt'
 SAVE_INTERVAL = 1000
+CHECKPOINT_INTERVAL = 1.0 # Segundos entre gravações do log de alterações da Q-table
+COMPACT_INTERVAL = 300.0 # Segundos entre snapshots completos (compactação do log)
 EXPLORATION_POLICY = 'epsilon-greedy'
 DRAW_THRESHOLD = 200
+MINIMAX_CURRICULUM = ((0, 1), (3000, 2), (8000, 3)) # (episódio inicial, profundidade do Minimax)
+LOG_FORMAT = 'text' # 'json': mensagens de progresso como uma linha JSON por evento
+
+def log_event(message, event, **fields):
+    # Mensagem de progresso: o texto de sempre, ou com LOG_FORMAT = 'json' uma
+    # linha JSON com o evento e os campos (para acompanhar execuções sem terminal)
+    if LOG_FORMAT == 'json':
+        print(json.dumps({'time': round(time.time(), 3), 'event': event, **fields}, ensure_ascii=False), flush=True)
+    else:
+        print(message)
 
 # Labels e tabuleiro
 titulo = "KAMISADO - Q-LEARNING TURBINADO"
@@ -52,6 +70,219 @@ color_emojis = {
 COLOR_TO_INT = {color: i for i, color in enumerate(sorted(list(set(board.flatten()))))}
 INT_TO_COLOR = {i: color for color, i in COLOR_TO_INT.items()}
 
+# Motor compacto do jogo
+
+WHITE, BLACK = 0, 1
+SIDE_NAMES = ('white', 'black')
+FORWARD_DIRS = ([(-1,-1),(-1,0),(-1,1)], [(1,-1),(1,0),(1,1)])
+NO_COLOR = -1 # next_color inteiro quando qualquer peça pode mover
+
+# Tabuleiro de cores como inteiros (COLOR_TO_INT), montado uma única vez
+COLOR_BOARD = np.array([[COLOR_TO_INT[color] for color in row] for row in board], dtype=np.int8)
+SQUARE_COLOR = [int(color) for color in COLOR_BOARD.flatten()]
+
+def _build_rays():
+    # RAYS[lado][casa] = 3 raios (uma tupla de casas por direção, em ordem de distância)
+    rays = ([], [])
+    for side in (WHITE, BLACK):
+        for sq in range(64):
+            r0, c0 = divmod(sq, 8)
+            side_rays = []
+            for dr, dc in FORWARD_DIRS[side]:
+                ray = []
+                r, c = r0+dr, c0+dc
+                while 0<=r<8 and 0<=c<8:
+                    ray.append(r*8 + c)
+                    r += dr
+                    c += dc
+                side_rays.append(tuple(ray))
+            rays[side].append(tuple(side_rays))
+    return rays
+
+RAYS = _build_rays()
+
+# Simetria do tabuleiro: espelhar as colunas (c -> 7 - c) leva cada cor a outra
+# cor fixa, a mesma em todas as linhas, e mantém os lados (as linhas não mudam).
+# Como as regras só comparam cores entre si, a posição espelhada com as cores
+# trocadas por essa permutação é equivalente, e a heurística também é simétrica.
+# (A rotação de 180° mantém as cores mas troca brancas e pretas, então não serve
+# para uma Q-table que sempre joga do ponto de vista das pretas.)
+# A permutação é tirada do próprio board; None se ele não tiver essa simetria.
+def _build_color_mirror():
+    mirror = {}
+    for r in range(8):
+        for c in range(8):
+            color, mirrored = int(COLOR_BOARD[r, c]), int(COLOR_BOARD[r, 7 - c])
+            if mirror.setdefault(color, mirrored) != mirrored:
+                return None
+    return [mirror[color] for color in range(len(mirror))]
+
+COLOR_MIRROR = _build_color_mirror()
+MIRROR_SQUARE = [sq ^ 7 for sq in range(64)] # r*8 + c -> r*8 + 7 - c
+BYTE_REVERSE = [int(f'{byte:08b}'[::-1], 2) for byte in range(256)] # espelha uma linha de bitboard
+HOME_ROW_MASK = (0xFF, 0xFF << 56) # linha de chegada das brancas (linha 0) e das pretas (linha 7)
+
+# Termos da heurística por casa, somados incrementalmente pelo Position:
+# progresso (pretas 25 por linha avançada, brancas -30) e controle do centro
+# (pretas +50, brancas -40 em cada uma das 4 casas centrais)
+CENTER_SQUARES = [3*8+3, 3*8+4, 4*8+3, 4*8+4] # (3, 3), (3, 4), (4, 3), (4, 4)
+PROGRESS_VALUE = ([-30 * (sq >> 3) for sq in range(64)], [25 * (7 - (sq >> 3)) for sq in range(64)])
+CENTER_VALUE = ([-40 if sq in CENTER_SQUARES else 0 for sq in range(64)],
+                [50 if sq in CENTER_SQUARES else 0 for sq in range(64)])
+
+def count_moves(squares, rays, color, occupied):
+    # Número de movimentos das peças em squares (restritas à cor, se houver) sem montá-los
+    n = 0
+    for sq in squares:
+        if color != NO_COLOR and SQUARE_COLOR[sq] != color: continue
+        for ray in rays[sq]:
+            for to in ray:
+                if occupied >> to & 1: break
+                n += 1
+    return n
+
+# Chaves de Zobrist (semente fixa para que os hashes sejam estáveis entre execuções).
+# Os rótulos das peças não entram no hash: só a casa importa para as regras.
+_zobrist_rng = random.Random(0x4B414D49)
+ZOBRIST_SQUARE = [[_zobrist_rng.getrandbits(64) for _ in range(64)] for _ in (WHITE, BLACK)]
+ZOBRIST_TURN = _zobrist_rng.getrandbits(64)
+ZOBRIST_COLOR = [_zobrist_rng.getrandbits(64) for _ in range(len(COLOR_TO_INT) + 1)] # índice next_color + 1
+# Chave da cor espelhada, para manter incrementalmente o hash da posição espelhada
+ZOBRIST_MIRROR_COLOR = [ZOBRIST_COLOR[(COLOR_MIRROR[c - 1] + 1) if c and COLOR_MIRROR else c]
+                        for c in range(len(COLOR_TO_INT) + 1)]
+
+class Position:
+    # Estado compacto: casas (r*8+c) das 8 peças de cada lado, indexadas pelo
+    # número da peça - 1, e um bitboard de ocupação por lado. next_color é o
+    # índice de COLOR_TO_INT (NO_COLOR para qualquer). Os movimentos são tuplas
+    # (peça, origem, destino) aplicadas no lugar com make_move/unmake_move, que
+    # também atualizam o hash de Zobrist e os termos de progresso e centro.
+    __slots__ = ('squares', 'bitboards', 'turn', 'next_color', 'no_progress', 'hash',
+                 'mirror_hash', 'progress', 'center')
+
+    def __init__(self, squares, turn=WHITE, next_color=NO_COLOR, no_progress=0):
+        self.squares = squares
+        self.bitboards = [0, 0]
+        for side in (WHITE, BLACK):
+            for sq in squares[side]:
+                self.bitboards[side] |= 1 << sq
+        self.turn = turn
+        self.next_color = next_color
+        self.no_progress = no_progress
+        self.hash = self.compute_hash()
+        self.mirror_hash = self.compute_hash(mirror=True)
+        self.progress = sum(PROGRESS_VALUE[side][sq] for side in (WHITE, BLACK) for sq in squares[side])
+        self.center = sum(CENTER_VALUE[side][sq] for side in (WHITE, BLACK) for sq in squares[side])
+
+    def compute_hash(self, mirror=False):
+        # mirror=True: hash da posição espelhada (ver COLOR_MIRROR)
+        if mirror and COLOR_MIRROR is None:
+            return self.compute_hash()
+        h = ZOBRIST_COLOR[(mirror_color(self.next_color) if mirror else self.next_color) + 1]
+        if self.turn == BLACK: h ^= ZOBRIST_TURN
+        for side in (WHITE, BLACK):
+            for sq in self.squares[side]:
+                h ^= ZOBRIST_SQUARE[side][MIRROR_SQUARE[sq] if mirror else sq]
+        return h
+
+    @classmethod
+    def from_dict(cls, state):
+        squares = [[0]*8, [0]*8]
+        for side, name in enumerate(SIDE_NAMES):
+            for lbl, (r, c) in state[name].items():
+                squares[side][int(lbl[1:]) - 1] = r*8 + c
+        turn = BLACK if state['turn'] == 'black' else WHITE
+        next_color = COLOR_TO_INT.get(state['next_color'], NO_COLOR)
+        return cls(squares, turn, next_color, state['no_progress'])
+
+    def to_dict(self):
+        return {
+            'white': {lbl: divmod(sq, 8) for lbl, sq in zip(white_labels, self.squares[WHITE])},
+            'black': {lbl: divmod(sq, 8) for lbl, sq in zip(black_labels, self.squares[BLACK])},
+            'turn': SIDE_NAMES[self.turn],
+            'next_color': INT_TO_COLOR.get(self.next_color),
+            'no_progress': self.no_progress
+        }
+
+    def child_dict(self, move):
+        # Estado em dicionário após o movimento, marcado com a tupla que o gerou
+        undo = self.make_move(move)
+        nxt = self.to_dict()
+        nxt['move'] = move
+        self.unmake_move(move, undo)
+        return nxt
+
+    def copy(self):
+        return Position([self.squares[WHITE][:], self.squares[BLACK][:]],
+                        self.turn, self.next_color, self.no_progress)
+
+    def legal_moves(self):
+        # Mesma ordem de successors(): peça, direção e depois distância
+        side = self.turn
+        occupied = self.bitboards[WHITE] | self.bitboards[BLACK]
+        next_color = self.next_color
+        rays = RAYS[side]
+        moves = []
+        for piece, frm in enumerate(self.squares[side]):
+            if next_color != NO_COLOR and SQUARE_COLOR[frm] != next_color: continue
+            for ray in rays[frm]:
+                for to in ray:
+                    if occupied >> to & 1: break
+                    moves.append((piece, frm, to))
+        return moves
+
+    def count_moves(self):
+        return count_moves(self.squares[self.turn], RAYS[self.turn], self.next_color,
+                           self.bitboards[WHITE] | self.bitboards[BLACK])
+
+    def make_move(self, move):
+        piece, frm, to = move
+        side = self.turn
+        undo = (self.next_color, self.no_progress, self.hash, self.mirror_hash)
+        self.squares[side][piece] = to
+        self.bitboards[side] ^= (1 << frm) | (1 << to)
+        col_to = SQUARE_COLOR[to]
+        if col_to == SQUARE_COLOR[frm]:
+            self.no_progress += 1
+        else:
+            self.no_progress = 0
+        self.hash ^= (ZOBRIST_SQUARE[side][frm] ^ ZOBRIST_SQUARE[side][to] ^ ZOBRIST_TURN ^
+                      ZOBRIST_COLOR[self.next_color + 1] ^ ZOBRIST_COLOR[col_to + 1])
+        self.mirror_hash ^= (ZOBRIST_SQUARE[side][frm ^ 7] ^ ZOBRIST_SQUARE[side][to ^ 7] ^ ZOBRIST_TURN ^
+                             ZOBRIST_MIRROR_COLOR[self.next_color + 1] ^ ZOBRIST_MIRROR_COLOR[col_to + 1])
+        self.progress += PROGRESS_VALUE[side][to] - PROGRESS_VALUE[side][frm]
+        self.center += CENTER_VALUE[side][to] - CENTER_VALUE[side][frm]
+        self.next_color = col_to
+        self.turn = side ^ 1
+        return undo
+
+    def unmake_move(self, move, undo):
+        piece, frm, to = move
+        side = self.turn ^ 1
+        self.turn = side
+        self.squares[side][piece] = frm
+        self.bitboards[side] ^= (1 << frm) | (1 << to)
+        self.progress += PROGRESS_VALUE[side][frm] - PROGRESS_VALUE[side][to]
+        self.center += CENTER_VALUE[side][frm] - CENTER_VALUE[side][to]
+        self.next_color, self.no_progress, self.hash, self.mirror_hash = undo
+
+    def rebase_move(self, move):
+        # Ajusta o índice da peça de um movimento vindo de outra posição com o
+        # mesmo hash (transposição com rótulos trocados); None se não se aplica
+        piece, frm, to = move
+        side_squares = self.squares[self.turn]
+        if frm not in side_squares:
+            return None
+        return (side_squares.index(frm), frm, to)
+
+    def winner(self):
+        if self.no_progress >= DRAW_THRESHOLD:
+            return 'draw'
+        if self.bitboards[WHITE] & HOME_ROW_MASK[WHITE]: return 'white'
+        if self.bitboards[BLACK] & HOME_ROW_MASK[BLACK]: return 'black'
+        return None
+
+
 # Funções do Jogo
 
 def print_game_state(state):
@@ -102,31 +333,10 @@ def initial_state():
     }
 
 def successors(state):
-    current = state['turn']
-    opponent = 'black' if current=='white' else 'white'
-    valid = []
-    occupied = set(state['white'].values()) | set(state['black'].values())
-    for lbl, (r0, c0) in state[current].items():
-        col0 = board[r0,c0]
-        if state['next_color'] and col0!=state['next_color']: continue
-        dirs = [(-1,-1),(-1,0),(-1,1)] if current=='white' else [(1,-1),(1,0),(1,1)]
-        for dr,dc in dirs:
-            step=1
-            while True:
-                r,c = r0+dr*step, c0+dc*step
-                if not (0<=r<8 and 0<=c<8): break
-                if (r,c) in occupied: break
-                nxt = deepcopy(state)
-                nxt[current][lbl]=(r,c)
-                nxt['next_color']=board[r,c]
-                nxt['turn']=opponent
-                if board[r,c]==col0:
-                    nxt['no_progress']+=1
-                else:
-                    nxt['no_progress']=0
-                valid.append(nxt)
-                step+=1
-    return valid
+    # Adaptador para o formato em dicionário: gera os filhos com make/unmake
+    # sobre um Position em vez de um deepcopy por sucessor
+    pos = Position.from_dict(state)
+    return [pos.child_dict(move) for move in pos.legal_moves()]
 
 def game_over(state):
     if state['no_progress']>=DRAW_THRESHOLD:
@@ -144,166 +354,2038 @@ def encode_state(state):
     c_encoded = COLOR_TO_INT.get(state['next_color'], -1) # -1 para None
     return (w,b,t,c_encoded)
 
+# Chaves compactas da Q-table
+#
+# Um estado vira (bitboard das brancas, bitboard das pretas, meta), com
+# meta = turno << 4 | (next_color + 1). Como a ação é o movimento de uma única
+# peça, ela é guardada como origem*64 + destino relativa ao estado, em vez de
+# um segundo estado completo. A chave de Q(s, a) é (brancas, pretas, meta << 12 | ação).
+
+def state_key(pos):
+    return (pos.bitboards[WHITE], pos.bitboards[BLACK], pos.turn << 4 | (pos.next_color + 1))
+
+def encode_state_key(state):
+    # Igual a state_key(Position.from_dict(state)), sem montar a Position
+    w = b = 0
+    for r, c in state['white'].values():
+        w |= 1 << (r*8 + c)
+    for r, c in state['black'].values():
+        b |= 1 << (r*8 + c)
+    turn = BLACK if state['turn'] == 'black' else WHITE
+    return (w, b, turn << 4 | (COLOR_TO_INT.get(state['next_color'], NO_COLOR) + 1))
+
+def move_code(move):
+    return move[1]*64 + move[2]
+
+def action_code(state, action):
+    # Código da ação que leva de state ao filho action (estados em dicionário)
+    move = action.get('move')
+    if move is not None:
+        return move_code(move)
+    side = state['turn']
+    for lbl, frm in state[side].items():
+        to = action[side][lbl]
+        if to != frm:
+            return (frm[0]*8 + frm[1])*64 + to[0]*8 + to[1]
+    raise ValueError("action não é um sucessor de state")
+
+def action_codes(state, actions):
+    # Códigos de todas as ações; os filhos de successors() já trazem o movimento
+    try:
+        return tuple([a['move'][1]*64 + a['move'][2] for a in actions])
+    except KeyError:
+        return tuple([action_code(state, a) for a in actions])
+
+def q_key(s_key, code):
+    w, b, meta = s_key
+    return (w, b, meta << 12 | code)
+
+def mirror_bitboard(bb):
+    return int.from_bytes(bytes(BYTE_REVERSE[row] for row in bb.to_bytes(8, 'little')), 'little')
+
+def mirror_color(color):
+    return color if color == NO_COLOR else COLOR_MIRROR[color]
+
+def mirror_state_key(s_key):
+    w, b, meta = s_key
+    return (mirror_bitboard(w), mirror_bitboard(b), meta & 0x10 | (mirror_color((meta & 0xF) - 1) + 1))
+
+MIRROR_CODE = 7*64 + 7 # XOR que espelha origem e destino de um código de ação
+
+def canonical_q_key(s_key, code):
+    # Representante canônico de (s, a) e do seu espelho: a menor das duas chaves
+    if COLOR_MIRROR is None:
+        raise ValueError("O tabuleiro não tem a simetria de espelhamento")
+    return min(q_key(s_key, code), q_key(mirror_state_key(s_key), code ^ MIRROR_CODE))
+
+def action_keys(s_key, codes, symmetry=False):
+    # Versão vetorizada de q_key/canonical_q_key para todas as ações de um
+    # mesmo estado: (brancas, pretas) escalares e o array das terceiras partes
+    codes = np.asarray(codes, dtype=np.uint32)
+    w, b, meta = s_key
+    x = np.uint32(meta << 12) | codes
+    if symmetry:
+        # O estado espelhado é o mesmo para todas as ações; só quando ele é
+        # igual ao original a escolha depende da ação
+        mw, mb, mmeta = mirror_state_key(s_key)
+        mx = np.uint32(mmeta << 12) | (codes ^ np.uint32(MIRROR_CODE))
+        if (mw, mb) < (w, b):
+            w, b, x = mw, mb, mx
+        elif (mw, mb) == (w, b):
+            x = np.minimum(x, mx)
+    return w, b, x
+
+def legacy_q_key(legacy_key):
+    # Converte uma chave antiga (encode_state(s), encode_state(a)) para q_key;
+    # None se a não for um movimento de uma única peça a partir de s
+    (w, b, t, c), (w2, b2, _, _) = legacy_key
+    before, after = (set(b), set(b2)) if t == 1 else (set(w), set(w2))
+    frm, to = before - after, after - before
+    if len(frm) != 1 or len(to) != 1:
+        return None
+    bitboards = [0, 0]
+    for side, squares in ((WHITE, w), (BLACK, b)):
+        for sq in squares:
+            bitboards[side] |= 1 << sq
+    return q_key((bitboards[WHITE], bitboards[BLACK], t << 4 | (c + 1)), frm.pop()*64 + to.pop())
+
+# Q-table compacta: tabela hash de endereçamento aberto (sondagem linear) sobre
+# arrays NumPy. Cada entrada ocupa 28 bytes (três partes da chave + valor) e a
+# tabela é mantida com no máximo metade das posições ocupadas.
+
+_Q_HASH_MULT = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+_Q_USED = 1 << 31 # Marca de posição ocupada na terceira parte da chave
+_MASK64 = (1 << 64) - 1
+
+def _q_hash(w, b, x, shift):
+    # Hash multiplicativo; usa os bits altos, que dependem de todos os bits da chave
+    # (os bits baixos dos bitboards quase nunca variam)
+    return (((w * _Q_HASH_MULT[0]) ^ (b * _Q_HASH_MULT[1]) ^ (x * _Q_HASH_MULT[2])) & _MASK64) >> shift
+
+def _q_hash_array(w, b, x, shift):
+    # Versão vetorizada de _q_hash (a multiplicação em uint64 já é módulo 2**64)
+    with np.errstate(over='ignore'):
+        h = ((w * np.uint64(_Q_HASH_MULT[0])) ^ (b * np.uint64(_Q_HASH_MULT[1])) ^
+             (x.astype(np.uint64) * np.uint64(_Q_HASH_MULT[2])))
+    return (h >> np.uint64(shift)).astype(np.int64)
+
+# x * _Q_HASH_MULT[2] (com a marca de ocupada) para toda terceira parte de
+# chave possível: meta tem 5 bits e a ação 12
+with np.errstate(over='ignore'):
+    _Q_HASH_X = (np.arange(1 << 17, dtype=np.uint64) | np.uint64(_Q_USED)) * np.uint64(_Q_HASH_MULT[2])
+
+Q_FILE_MAGIC = b'KQT1'
+Q_FILE_DTYPES = ('<u8', '<u8', '<u4', '<f8') # brancas, pretas, meta << 12 | ação, valor
+
+def _q_file_offset(header_len):
+    return (8 + header_len + 63) // 64 * 64
+
+def is_q_table_file(filename):
+    with open(filename, 'rb') as f:
+        return f.read(4) == Q_FILE_MAGIC
+
+class QTable:
+    def __init__(self, capacity=1 << 16):
+        self._allocate(max(16, 1 << (int(capacity) - 1).bit_length()))
+        self._lock = None
+        self._dirty = None
+
+    def _allocate(self, capacity):
+        # Só os arrays: ao crescer, a trava e as alterações pendentes continuam
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.shift = 64 - (capacity.bit_length() - 1)
+        self.keys_w = np.zeros(capacity, dtype=np.uint64)
+        self.keys_b = np.zeros(capacity, dtype=np.uint64)
+        self.keys_x = np.zeros(capacity, dtype=np.uint32) # 0 = vazia
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.count = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_lock'] = state['_dirty'] = None # O rastreamento de alterações fica só no processo original
+        return state
+
+    def track_changes(self):
+        # Passa a registrar as chaves alteradas (para o checkpoint incremental);
+        # a partir daqui as escritas passam por uma trava
+        if self._lock is None:
+            self._dirty = set()
+            self._lock = threading.Lock()
+
+    def take_changes(self):
+        # Devolve e esquece as (chave, valor) alteradas desde a última chamada
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return [(key, self.get(key)) for key in dirty]
+
+    def snapshot(self):
+        # Cópia consistente da tabela; as alterações pendentes passam a estar nela
+        with self._lock:
+            copy = QTable.__new__(QTable)
+            copy.__dict__.update(self.__getstate__())
+            copy.keys_w, copy.keys_b = self.keys_w.copy(), self.keys_b.copy()
+            copy.keys_x, copy.values = self.keys_x.copy(), self.values.copy()
+            self._dirty = set()
+            return copy
+
+    def __len__(self):
+        return self.count
+
+    def _find(self, w, b, x):
+        # Índice da chave ou da primeira posição vazia da sua sequência de sondagem
+        mask = self.mask
+        keys_x = self.keys_x
+        i = _q_hash(w, b, x, self.shift)
+        while True:
+            kx = keys_x[i]
+            if kx == 0 or (kx == x and self.keys_w[i] == w and self.keys_b[i] == b):
+                return i
+            i = (i + 1) & mask
+
+    def get(self, key, default=0.0):
+        w, b, x = key
+        x |= _Q_USED
+        i = self._find(w, b, x)
+        if self.keys_x[i] == 0:
+            return default
+        return float(self.values[i])
+
+    def get_many(self, w, b, x, default=0.0):
+        # Versão vetorizada de get: todas as chaves pendentes avançam juntas na
+        # sua sondagem até achar a chave ou uma posição vazia. w e b podem ser
+        # inteiros (ações de um mesmo estado); aí a parte do hash que vem
+        # deles é calculada uma única vez
+        same_state = isinstance(w, int)
+        if same_state:
+            h = ((w * _Q_HASH_MULT[0]) ^ (b * _Q_HASH_MULT[1])) & _MASK64
+            slots = (_Q_HASH_X[x] ^ h) >> self.shift
+        else:
+            slots = _q_hash_array(w, b, x | _Q_USED, self.shift)
+        x = x | _Q_USED
+        kx = self.keys_x[slots]
+        hit = (kx == x) & (self.keys_w[slots] == w) & (self.keys_b[slots] == b)
+        out = np.where(hit, self.values[slots], default)
+        miss = (kx != 0) ^ hit # Posição ocupada por outra chave
+        if not miss.any():
+            return out
+        pending = miss.nonzero()[0]
+        while len(pending):
+            slots[pending] = (slots[pending] + 1) & self.mask
+            cand = slots[pending]
+            kx = self.keys_x[cand]
+            hit = kx == x[pending]
+            if same_state:
+                hit &= (self.keys_w[cand] == w) & (self.keys_b[cand] == b)
+            else:
+                hit &= (self.keys_w[cand] == w[pending]) & (self.keys_b[cand] == b[pending])
+            out[pending[hit]] = self.values[cand[hit]]
+            pending = pending[~hit & (kx != 0)]
+        return out
+
+    def _find_many(self, w, b, x):
+        # Versão vetorizada de _find (x já com a marca de ocupada): posições das
+        # chaves e se cada uma já está na tabela
+        slots = _q_hash_array(w, b, x, self.shift)
+        found = np.zeros(len(w), dtype=bool)
+        pending = np.arange(len(w))
+        while len(pending):
+            cand = slots[pending]
+            kx = self.keys_x[cand]
+            hit = (kx == x[pending]) & (self.keys_w[cand] == w[pending]) & (self.keys_b[cand] == b[pending])
+            found[pending[hit]] = True
+            pending = pending[~hit & (kx != 0)]
+            slots[pending] = (slots[pending] + 1) & self.mask
+        return slots, found
+
+    def set_many(self, w, b, x, values):
+        # Versão vetorizada de __setitem__; se uma chave se repete, fica o último valor
+        w, b = np.asarray(w, dtype=np.uint64), np.asarray(b, dtype=np.uint64)
+        x, values = np.asarray(x, dtype=np.uint32), np.asarray(values, dtype=np.float64)
+        keys = np.empty(len(w), dtype=[('w', '<u8'), ('b', '<u8'), ('x', '<u4')])
+        keys['w'], keys['b'], keys['x'] = w, b, x
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(w) - 1 - last
+        w, b, x, values = w[last], b[last], x[last], values[last]
+        if self._lock is None:
+            self._set_many(w, b, x, values)
+        else:
+            with self._lock:
+                self._set_many(w, b, x, values)
+                self._dirty.update(zip(w.tolist(), b.tolist(), x.tolist()))
+
+    def _set_many(self, w, b, x, values):
+        slots, found = self._find_many(w, b, x | np.uint32(_Q_USED))
+        self.values[slots[found]] = values[found]
+        new = ~found
+        if new.any():
+            if (self.count + int(new.sum())) * 2 > self.capacity:
+                self._grow((self.count + int(new.sum())) * 2)
+            self._insert_new(w[new], b[new], x[new], values[new])
+
+    def __getitem__(self, key):
+        w, b, x = key
+        i = self._find(w, b, x | _Q_USED)
+        if self.keys_x[i] == 0:
+            raise KeyError(key)
+        return float(self.values[i])
+
+    def __contains__(self, key):
+        w, b, x = key
+        return self.keys_x[self._find(w, b, x | _Q_USED)] != 0
+
+    def __setitem__(self, key, value):
+        if self._lock is None:
+            self._set(key, value)
+        else:
+            with self._lock:
+                self._set(key, value)
+                self._dirty.add(key)
+
+    def _set(self, key, value):
+        w, b, x = key
+        x |= _Q_USED
+        i = self._find(w, b, x)
+        if self.keys_x[i] == 0:
+            if (self.count + 1) * 2 > self.capacity:
+                self._grow()
+                i = self._find(w, b, x)
+            self.keys_w[i], self.keys_b[i], self.keys_x[i] = w, b, x
+            self.count += 1
+        self.values[i] = value
+
+    def arrays(self):
+        # (brancas, pretas, meta << 12 | ação, valor) das entradas ocupadas
+        used = self.keys_x != 0
+        return (self.keys_w[used], self.keys_b[used],
+                self.keys_x[used] & np.uint32(_Q_USED - 1), self.values[used])
+
+    def items(self):
+        for w, b, x, v in zip(*(a.tolist() for a in self.arrays())):
+            yield (w, b, x), v
+
+    def _insert_new(self, w, b, x, values):
+        # Insere em lote chaves distintas que ainda não estão na tabela: a cada
+        # rodada, cada chave pendente tenta a próxima posição da sua sondagem e
+        # só a primeira de cada posição livre fica com ela
+        x = x | np.uint32(_Q_USED)
+        pending = np.arange(len(w))
+        slots = _q_hash_array(w, b, x, self.shift)
+        while len(pending):
+            cand = slots[pending]
+            free = self.keys_x[cand] == 0
+            _, first = np.unique(cand, return_index=True)
+            winners = np.zeros(len(pending), dtype=bool)
+            winners[first] = True
+            winners &= free
+            idx, chosen = cand[winners], pending[winners]
+            self.keys_w[idx], self.keys_b[idx] = w[chosen], b[chosen]
+            self.keys_x[idx], self.values[idx] = x[chosen], values[chosen]
+            pending = pending[~winners]
+            slots[pending] = (slots[pending] + 1) & self.mask
+        self.count += len(w)
+
+    def _grow(self, min_capacity=None):
+        # Chamada de _set/_set_many, já dentro da trava quando há rastreamento
+        w, b, x, v = self.arrays()
+        capacity = self.capacity * 2
+        while min_capacity and capacity < min_capacity:
+            capacity *= 2
+        self._allocate(capacity)
+        self._insert_new(w, b, x, v)
+
+    @classmethod
+    def from_arrays(cls, w, b, x, values):
+        table = cls(len(w) * 2)
+        table._insert_new(np.asarray(w, dtype=np.uint64), np.asarray(b, dtype=np.uint64),
+                          np.asarray(x, dtype=np.uint32), np.asarray(values, dtype=np.float64))
+        return table
+
+    @classmethod
+    def from_legacy(cls, legacy_table):
+        # Converte a Q-table antiga em dicionário ({(encode_state(s), encode_state(a)): q})
+        keys, values = [], []
+        for legacy_key, value in legacy_table.items():
+            key = legacy_q_key(legacy_key)
+            if key is not None:
+                keys.append(key)
+                values.append(value)
+        if not keys:
+            return cls()
+        w, b, x = zip(*keys)
+        return cls.from_arrays(w, b, x, values)
+
+    # Arquivo binário: b'KQT1', tamanho do cabeçalho (uint32), cabeçalho JSON e,
+    # a partir do próximo múltiplo de 64 bytes, os quatro arrays da tabela hash
+    # exatamente como estão na memória. Assim load() pode mapear o arquivo com
+    # mmap sem reconstruir nada.
+
+    def save(self, filename, meta=None):
+        # Escreve num arquivo temporário array por array e troca com os.replace
+        header = json.dumps({'version': 1, 'capacity': self.capacity, 'count': self.count,
+                             'meta': meta or {}}).encode('utf-8')
+        offset = _q_file_offset(len(header))
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(Q_FILE_MAGIC + struct.pack('<I', len(header)) + header)
+            f.write(b'\0' * (offset - 8 - len(header)))
+            for arr, dtype in zip((self.keys_w, self.keys_b, self.keys_x, self.values), Q_FILE_DTYPES):
+                f.write(memoryview(np.ascontiguousarray(arr, dtype=dtype)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename, mmap=False):
+        # Devolve (tabela, meta). Com mmap=True os arrays apontam para o arquivo
+        # (cópia na escrita: alterações ficam só na memória do processo)
+        with open(filename, 'rb') as f:
+            if f.read(4) != Q_FILE_MAGIC:
+                raise ValueError(f"{filename} não é um arquivo de Q-table")
+            (header_len,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_len).decode('utf-8'))
+        capacity = header['capacity']
+        offset = _q_file_offset(header_len)
+        arrays = []
+        for dtype in Q_FILE_DTYPES:
+            if mmap:
+                arrays.append(np.memmap(filename, dtype=dtype, mode='c', offset=offset, shape=(capacity,)))
+            else:
+                arrays.append(np.fromfile(filename, dtype=dtype, count=capacity, offset=offset))
+            offset += capacity * np.dtype(dtype).itemsize
+        table = cls.__new__(cls)
+        table.capacity = capacity
+        table.mask = capacity - 1
+        table.shift = 64 - (capacity.bit_length() - 1)
+        table.keys_w, table.keys_b, table.keys_x, table.values = arrays
+        table.count = header['count']
+        table._lock = table._dirty = None
+        return table, header['meta']
+
+    def prune(self, threshold=1e-6):
+        w, b, x, v = self.arrays()
+        keep = np.abs(v) > threshold
+        if keep.all():
+            return self
+        return QTable.from_arrays(w[keep], b[keep], x[keep], v[keep])
+
+# Log de alterações (write-ahead log) do checkpoint incremental: cabeçalho com
+# b'KQTW' e a geração do snapshot a que se refere, seguido de registros de
+# tamanho fixo com (brancas, pretas, meta << 12 | ação, valor)
+Q_WAL_MAGIC = b'KQTW'
+Q_WAL_RECORD = np.dtype([('w', '<u8'), ('b', '<u8'), ('x', '<u4'), ('v', '<f8')])
+
+def write_wal_header(filename, generation):
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(Q_WAL_MAGIC + struct.pack('<IQ', 0, generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+def append_wal(filename, changes):
+    records = np.empty(len(changes), dtype=Q_WAL_RECORD)
+    for i, ((w, b, x), v) in enumerate(changes):
+        records[i] = (w, b, x, v)
+    with open(filename, 'ab') as f:
+        f.write(records.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_wal(filename):
+    # (geração, registros); um registro incompleto no fim (queda no meio da escrita) é descartado
+    with open(filename, 'rb') as f:
+        header = f.read(16)
+        if len(header) < 16 or header[:4] != Q_WAL_MAGIC:
+            return None, np.empty(0, dtype=Q_WAL_RECORD)
+        (_, generation) = struct.unpack('<IQ', header[4:])
+        data = f.read()
+    usable = len(data) - len(data) % Q_WAL_RECORD.itemsize
+    return generation, np.frombuffer(data[:usable], dtype=Q_WAL_RECORD)
+
+def load_legacy_q_file(filename):
+    # Lê um arquivo pickle antigo ({'q_table', 'stats', 'epsilon'}), convertendo
+    # a Q-table em dicionário para QTable se necessário
+    with open(filename, 'rb') as f:
+        data = pickle.load(f)
+    if isinstance(data['q_table'], dict): # Formato antigo, com estados inteiros como chave
+        data['q_table'] = QTable.from_legacy(data['q_table'])
+    return data
+
+def convert_q_table(src, dst):
+    # Converte um arquivo pickle antigo para o formato binário de QTable.save
+    data = load_legacy_q_file(src)
+    data['q_table'].save(dst, {'stats': data['stats'], 'epsilon': data['epsilon']})
+    return len(data['q_table'])
+
 #A Agentes
 
 class QLearningAgent:
-    def __init__(self, alpha, gamma, epsilon, policy=EXPLORATION_POLICY):
+    def __init__(self, alpha, gamma, epsilon, policy=EXPLORATION_POLICY, saver=True, symmetry=False, tablebase=None):
         self.alpha, self.gamma = alpha, gamma
+        # Tabela de finais (opcional) para reforçar a recompensa contra o Minimax
+        self.tablebase = tablebase
         self.epsilon = epsilon
         self.policy = policy
-        self.q_table = {}
+        # Com symmetry, uma posição e a sua espelhada dividem as mesmas entradas
+        self.symmetry = symmetry
+        if symmetry and COLOR_MIRROR is None:
+            raise ValueError("O tabuleiro não tem a simetria de espelhamento")
+        self.q_table = QTable()
         self.stats = {'wins':0,'losses':0,'draws':0,'total_rewards':0}
         self.training_mode=True
+        # Últimos Q(s, a) consultados em lote: (tabela, s, códigos, chaves, valores)
+        self._q_cache=None
+        # Checkpoint incremental (start_checkpointing): arquivo, geração do
+        # snapshot atual e pedido de compactação
+        self._checkpoint_path=None
+        self._generation=0
+        self._compact_requested=False
+        self._last_compact=time.time()
+        self._checkpoint_lock=threading.RLock()
         self._stop_saver=False
-        self._saver=threading.Thread(target=self._periodic_save)
-        self._saver.daemon=True
-        self._saver.start()
+        self._saver=None
+        if saver: # Os processos de treino paralelo não precisam da thread de salvamento
+            self._saver=threading.Thread(target=self._periodic_save)
+            self._saver.daemon=True
+            self._saver.start()
 
     def _periodic_save(self):
+      # A cada CHECKPOINT_INTERVAL grava no log as entradas alteradas e, de
+      # tempos em tempos (ou quando pedido), compacta o log num snapshot completo
       while not self._stop_saver:
-        time.sleep(1)
+        time.sleep(CHECKPOINT_INTERVAL)
+        if self._checkpoint_path is None:
+            continue
         try:
-            pass
+            self._flush_wal()
+            if self._compact_requested or time.time() - self._last_compact >= COMPACT_INTERVAL:
+                self._compact()
         except Exception as e:
-            print(f"⚠️ Erro ao salvar Q-table (assíncrono): {e}")
-
-    def get_q(self,s,a): return self.q_table.get((s,a),0.0)
+            log_event(f"⚠️ Erro ao salvar Q-table (assíncrono): {e}", 'checkpoint_error', error=str(e))
+
+    def __getstate__(self):
+        # A thread de salvamento e as travas não são serializáveis (processos de avaliação/treino)
+        state = self.__dict__.copy()
+        state['_saver'] = None
+        state['_checkpoint_lock'] = None
+        state['_checkpoint_path'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._checkpoint_lock = threading.RLock()
+
+    def start_checkpointing(self, filename):
+        # Liga o checkpoint em segundo plano: grava já um snapshot e depois só
+        # as alterações (filename + '.wal'), sem pausar o treino
+        with self._checkpoint_lock:
+            self.q_table.track_changes()
+            self._checkpoint_path = filename
+            self._compact()
+
+    def checkpoint(self, filename):
+        # Nos intervalos de treino: só pede a compactação se o checkpoint em
+        # segundo plano estiver ligado para este arquivo; senão, salva na hora
+        if self._checkpoint_path == filename:
+            self._compact_requested = True
+        else:
+            self.save(filename)
+
+    def _flush_wal(self):
+        with self._checkpoint_lock:
+            changes = self.q_table.take_changes()
+            if changes:
+                append_wal(self._checkpoint_path + '.wal', changes)
+            self._write_checkpoint_meta()
+
+    def _write_checkpoint_meta(self):
+        # stats e epsilon acompanham o log num JSON pequeno, trocado atomicamente
+        meta_fn = self._checkpoint_path + '.wal.json'
+        with open(meta_fn + '.tmp', 'w') as f:
+            json.dump({'generation': self._generation, 'stats': self.stats, 'epsilon': self.epsilon}, f)
+        os.replace(meta_fn + '.tmp', meta_fn)
+
+    def _compact(self):
+        # Snapshot da geração seguinte e log novo; um log de geração antiga que
+        # sobre após uma queda é ignorado na recuperação, pois já está no snapshot
+        with self._checkpoint_lock:
+            snapshot = self.q_table.snapshot()
+            generation = self._generation + 1
+            snapshot.save(self._checkpoint_path, {'stats': dict(self.stats), 'epsilon': self.epsilon,
+                                                  'generation': generation, 'symmetry': self.symmetry})
+            self._generation = generation
+            write_wal_header(self._checkpoint_path + '.wal', generation)
+            self._write_checkpoint_meta()
+            self._compact_requested = False
+            self._last_compact = time.time()
+
+    def _recover_wal(self, fn, meta):
+        # Reaplica o log da mesma geração do snapshot carregado
+        generation = meta.get('generation', 0)
+        self._generation = generation
+        wal_fn = fn + '.wal'
+        if not os.path.exists(wal_fn):
+            return 0
+        wal_generation, records = read_wal(wal_fn)
+        if wal_generation != generation:
+            return 0
+        for w, b, x, v in zip(records['w'].tolist(), records['b'].tolist(), records['x'].tolist(), records['v'].tolist()):
+            self.q_table[(w, b, x)] = v
+        if os.path.exists(wal_fn + '.json'):
+            with open(wal_fn + '.json') as f:
+                wal_meta = json.load(f)
+            if wal_meta.get('generation') == generation:
+                meta['stats'], meta['epsilon'] = wal_meta['stats'], wal_meta['epsilon']
+        return len(records)
+
+    # s é uma chave de estado (state_key) e a o código da ação (move_code)
+    def get_q(self,s,a): return self.q_table.get(self.key(s,a),0.0)
+
+    def key(self,s,a):
+        return canonical_q_key(s,a) if self.symmetry else q_key(s,a)
+
+    def action_values(self,s,codes):
+        # Q(s, a) de todas as ações numa consulta só; o resultado fica guardado,
+        # pois o max de update() e a escolha seguinte costumam ser no mesmo estado
+        cache=self._q_cache
+        if cache is not None and cache[0] is self.q_table and cache[1]==s and cache[2]==codes:
+            return cache[4]
+        keys=action_keys(s,codes,self.symmetry)
+        qs=self.q_table.get_many(*keys)
+        self._q_cache=(self.q_table,s,codes,keys,qs)
+        return qs
 
     def choose_action(self,state,actions):
         if not actions: return None
-        s=encode_state(state)
+        s=encode_state_key(state)
         if self.training_mode and random.random()<self.epsilon:
             return random.choice(actions)
+        qs=self.action_values(s,action_codes(state,actions))
         if self.policy=='softmax':
-            qs=[self.get_q(s,encode_state(a)) for a in actions]
-            max_q = max(qs) if qs else 0
-            exps=[math.exp(q - max_q) for q in qs]
-            sum_exps = sum(exps)
+            exps=np.exp(qs-qs.max())
+            sum_exps=exps.sum()
             if sum_exps == 0:
                 return random.choice(actions)
-            ps=[e/sum_exps for e in exps]
-            return random.choices(actions,ps)[0]
-        # Greedy
-        return max(actions, key=lambda a:self.get_q(s,encode_state(a)))
+            return random.choices(actions,(exps/sum_exps).tolist())[0]
+        # Greedy (argmax fica com a primeira ação de maior valor, como max())
+        return actions[int(np.argmax(qs))]
 
     def update(self,s,a,r,s2,next_acts):
-        s_enc, a_enc = encode_state(s), encode_state(a)
-        cur=self.get_q(s_enc,a_enc)
+        self.update_encoded(encode_state_key(s), action_code(s,a), r, encode_state_key(s2),
+                            action_codes(s2,next_acts))
+
+    def update_encoded(self,s_key,a_code,r,s2_key,next_codes):
+        # Mesma atualização de update(), com chaves de estado e códigos de ação
+        cur=self.get_q(s_key,a_code)
         nxt=0.0
-        if next_acts:
-            nxt=max(self.get_q(encode_state(s2),encode_state(a2)) for a2 in next_acts)
-        self.q_table[(s_enc,a_enc)] = cur + self.alpha*(r+self.gamma*nxt-cur)
+        if next_codes:
+            nxt=float(self.action_values(s2_key,tuple(next_codes)).max())
+        key=self.key(s_key,a_code)
+        value=cur + self.alpha*(r+self.gamma*nxt-cur)
+        self.q_table[key]=value
+        # Mantém os valores guardados em dia (com simetria, a chave escrita pode
+        # ser a de outra ação do estado guardado)
+        cache=self._q_cache
+        if cache is not None and cache[0] is self.q_table:
+            w,b,x=cache[3]
+            if w==key[0] and b==key[1]:
+                cache[4][x==key[2]]=value
+
+    def replay(self,buffer,batch_size=None):
+        # Uma atualização em lote com transições sorteadas do ReplayBuffer: os
+        # Q(s, a) e os max Q(s2, ·) do lote saem de duas consultas get_many e os
+        # novos valores são gravados com set_many (todos calculados com a tabela
+        # de antes do lote). Devolve os erros TD, que atualizam as prioridades
+        idx,weights=buffer.sample(batch_size or buffer.batch_size)
+        if not len(idx):
+            return np.zeros(0)
+        w,b,x=buffer.w[idx],buffer.b[idx],buffer.x[idx]
+        cur=self.q_table.get_many(w,b,x)
+        counts=buffer.next_count[idx]
+        valid=np.arange(REPLAY_MAX_ACTIONS)<counts[:,None]
+        rows=np.broadcast_to(np.arange(len(idx))[:,None],valid.shape)[valid]
+        next_q=np.full(valid.shape,-np.inf)
+        next_q[valid]=self.q_table.get_many(buffer.next_w[idx][rows],buffer.next_b[idx][rows],buffer.next_x[idx][valid])
+        nxt=np.where(counts>0,next_q.max(axis=1),0.0)
+        td=buffer.r[idx]+self.gamma*nxt-cur
+        self.q_table.set_many(w,b,x,cur+self.alpha*weights*td)
+        self._q_cache=None
+        buffer.update_priorities(idx,td)
+        return td
 
     def decay_epsilon(self):
         self.epsilon=max(EPSILON_MIN,self.epsilon*EPSILON_DECAY)
 
     def prune_q_table(self, threshold=1e-6):
-      self.q_table = {k: v for k, v in self.q_table.items() if abs(v) > threshold}
+      with self._checkpoint_lock:
+        tracking = self.q_table._lock is not None
+        self.q_table = self.q_table.prune(threshold)
+        if tracking:
+            self.q_table.track_changes()
+            self._compact_requested = True # A tabela podada ainda não está em nenhum snapshot
 
     def save(self, filename):
-      self.prune_q_table()
-      with open(filename, 'wb') as f:
-        pickle.dump({'q_table': self.q_table, 'stats': self.stats, 'epsilon': self.epsilon}, f)
-      print(f"💾 Salvo: {len(self.q_table)} Q-entradas")
-
-    def load(self,fn):
+      # Grava a tabela hash como está, sem podar (use prune_q_table() para podar)
+      if self._checkpoint_path == filename:
+        self._compact() # Mantém snapshot e log de alterações coerentes
+      else:
+        self.q_table.save(filename, {'stats': self.stats, 'epsilon': self.epsilon, 'generation': self._generation,
+                                     'symmetry': self.symmetry})
+        # Um log que sobrou de outro checkpoint neste arquivo é anterior a este
+        # snapshot e, se a geração coincidisse, seria reaplicado por cima dele
+        for stale in (filename + '.wal', filename + '.wal.json'):
+            if os.path.exists(stale):
+                os.remove(stale)
+      log_event(f"💾 Salvo: {len(self.q_table)} Q-entradas", 'saved', file=filename, entries=len(self.q_table))
+
+    def load(self,fn,mmap=False):
+        # mmap=True mapeia o arquivo em vez de lê-lo (para jogar e avaliar).
+        # Se fn não existir, tenta o arquivo .pkl antigo de mesmo nome
+        legacy_fn = os.path.splitext(fn)[0] + '.pkl'
+        if not os.path.exists(fn) and os.path.exists(legacy_fn):
+            fn = legacy_fn
         if os.path.exists(fn):
-            with open(fn,'rb') as f: data=pickle.load(f)
-            self.q_table,self.stats,self.epsilon=data['q_table'],data['stats'],data['epsilon']
-            print(f"📥 Carregado: {len(self.q_table)} Q-entradas")
+            if is_q_table_file(fn):
+                self.q_table, data = QTable.load(fn, mmap=mmap)
+                recovered = self._recover_wal(fn, data)
+                if recovered:
+                    log_event(f"♻️ Recuperadas {recovered} alterações do log de checkpoint", 'wal_recovered', records=recovered)
+            else:
+                data = load_legacy_q_file(fn)
+                self.q_table = data['q_table']
+            self.stats,self.epsilon=data['stats'],data['epsilon']
+            self.symmetry=data.get('symmetry',False) # As chaves só servem com a mesma canonicalização
+            log_event(f"📥 Carregado: {len(self.q_table)} Q-entradas", 'loaded', file=fn, entries=len(self.q_table))
             return True
-        print("⚠️ Arquivo não encontrado")
+        log_event("⚠️ Arquivo não encontrado", 'file_not_found', file=fn)
         return False
 
     def stop(self):
         self._stop_saver=True
-        self._saver.join()
+        if self._saver is not None:
+            self._saver.join()
+        if self._checkpoint_path is not None:
+            self._flush_wal()
+
+# Replay de experiência: as transições já codificadas ficam em arrays de
+# capacidade fixa (as mais antigas são sobrescritas) com as chaves da Q-table
+# prontas, inclusive as de todas as ações do estado seguinte, e são reusadas
+# em atualizações em lote (QLearningAgent.replay)
+
+REPLAY_CAPACITY = 100_000
+REPLAY_BATCH = 256
+REPLAY_RATIO = 4 # Transições sorteadas por transição nova
+REPLAY_MAX_ACTIONS = 8 * 3 * 7 # peças x direções x distâncias
+
+class ReplayBuffer:
+    # prioritized=True sorteia com probabilidade proporcional a |erro TD| ** alpha
+    # e corrige o viés com pesos de importância (expoente beta) no passo de cada
+    # atualização; sem ela, o sorteio é uniforme. batch_size é o tamanho dos
+    # lotes e ratio quantas vezes, na média, cada transição nova é sorteada
+    def __init__(self, capacity=REPLAY_CAPACITY, symmetry=False, prioritized=False, alpha=0.6, beta=0.4, seed=0,
+                 batch_size=REPLAY_BATCH, ratio=REPLAY_RATIO):
+        self.capacity, self.symmetry = capacity, symmetry
+        self.batch_size, self.ratio = batch_size, ratio
+        self.prioritized, self.alpha, self.beta = prioritized, alpha, beta
+        self.w = np.zeros(capacity, dtype=np.uint64)
+        self.b = np.zeros(capacity, dtype=np.uint64)
+        self.x = np.zeros(capacity, dtype=np.uint32)
+        self.r = np.zeros(capacity, dtype=np.float64)
+        self.next_w = np.zeros(capacity, dtype=np.uint64)
+        self.next_b = np.zeros(capacity, dtype=np.uint64)
+        self.next_x = np.zeros((capacity, REPLAY_MAX_ACTIONS), dtype=np.uint32)
+        self.next_count = np.zeros(capacity, dtype=np.int16)
+        self.priority = np.zeros(capacity, dtype=np.float64)
+        self.max_priority = 1.0
+        self.size = 0
+        self.pos = 0
+        self.rng = np.random.default_rng(seed)
+        self._credit = 0 # Transições a sortear ainda não usadas em lotes
+
+    def __len__(self):
+        return self.size
+
+    def add(self, s_key, a_code, r, s2_key, next_codes):
+        # Mesmos argumentos de QLearningAgent.update_encoded
+        i = self.pos
+        w, b, x = action_keys(s_key, (a_code,), self.symmetry)
+        self.w[i], self.b[i], self.x[i], self.r[i] = w, b, x[0], r
+        n = len(next_codes)
+        if n:
+            self.next_w[i], self.next_b[i], self.next_x[i, :n] = action_keys(s2_key, next_codes, self.symmetry)
+        self.next_count[i] = n
+        self.priority[i] = self.max_priority # Transição nova: sorteada logo
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def extend(self, transitions):
+        for transition in transitions:
+            self.add(*transition)
+
+    def sample(self, batch_size):
+        # (índices, pesos de importância)
+        if not self.size:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        if not self.prioritized:
+            return self.rng.integers(0, self.size, batch_size), np.ones(batch_size)
+        p = self.priority[:self.size] ** self.alpha
+        p /= p.sum()
+        idx = self.rng.choice(self.size, batch_size, p=p)
+        weights = (self.size * p[idx]) ** -self.beta
+        return idx, weights / weights.max()
+
+    def update_priorities(self, idx, td_errors):
+        if self.prioritized:
+            priority = np.abs(td_errors) + 1e-6
+            self.priority[idx] = priority
+            self.max_priority = max(self.max_priority, float(priority.max()))
+
+    def replay_batches(self, new_transitions):
+        # Quantos lotes sortear depois de guardar new_transitions
+        if self.size < self.batch_size:
+            return 0
+        self._credit += new_transitions * self.ratio
+        batches = int(self._credit // self.batch_size)
+        self._credit -= batches * self.batch_size
+        return batches
 
 # Função heurística
-def advanced_heuristic(state):
-    score = 0
-
-    # Progresso em direção à vitória
-    black_progress = sum(7 - pos[0] for pos in state['black'].values()) * 25
-    white_progress = sum(pos[0] for pos in state['white'].values()) * 30
-    progress = black_progress - white_progress
-
-    # Controle do centro do tabuleiro
-    center_positions = [(3, 3), (3, 4), (4, 3), (4, 4)]
-    center_control = 0
-    for pos in center_positions:
-        if pos in state['black'].values():
-            center_control += 50
-        elif pos in state['white'].values():
-            center_control -= 40
-
-    # Mobilidade
-    mobility = len(successors(state))
-    if state['turn'] == 'black':
+def position_heuristic(pos):
+    # Progresso em direção à vitória e controle do centro já vêm somados do
+    # Position; a mobilidade é só contada, sem gerar os movimentos
+    mobility = pos.count_moves()
+    if pos.turn == BLACK:
         mobility *= 10
     else:
         mobility *= -8
 
     # Combinação dos fatores
-    score = progress * 0.5 + center_control * 0.3 + mobility * 0.2
+    score = pos.progress * 0.5 + pos.center * 0.3 + mobility * 0.2
     return int(score)
 
+def advanced_heuristic(state):
+    return position_heuristic(Position.from_dict(state))
+
+# Tabela de finais
+#
+# Resultado exato das posições em que o lado a jogar vence ou perde à força em
+# até max_plies plies, com a distância e o melhor movimento. A distância é a
+# profundidade de Minimax em que o resultado aparece (uma derrota por falta de
+# movimentos conta um ply a mais, pois a busca só olha os movimentos com
+# profundidade restante), e a regra é a do Minimax: sem movimentos, perde quem
+# joga. Os resultados não dependem dos rótulos das peças nem (longe do empate
+# por no_progress) de no_progress, então a chave é o hash de Zobrist, ou o
+# menor entre ele e o do espelho. No arquivo, as chaves ficam ordenadas em
+# arrays: hash, distância (positiva: o lado a jogar vence) e movimento
+# (origem*64 + destino no referencial da chave, -1 se não houver).
+
+TABLEBASE_FILE = 'kamisado_tablebase.ktb'
+TABLEBASE_PLIES = 5
+TABLEBASE_MAGIC = b'KTB1'
+TABLEBASE_DTYPES = ('<u8', '<i1', '<i2')
+TABLEBASE_REWARD = 1000.0 # Recompensa de um final ganho, descontada por gamma ** distância
+
+class EndgameSolver:
+    # Busca de prova sobre o Position: win_in(pos, n) diz se o lado a jogar
+    # vence em até n plies, lose_in(pos, n) se perde. Os resultados ficam
+    # guardados por (hash, n) enquanto o solver viver.
+    def __init__(self):
+        self.cache = {}
+        self.nodes = 0
+
+    def win_in(self, pos, n):
+        if n < 1:
+            return False
+        key = (pos.hash, n, True)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        self.nodes += 1
+        mover = SIDE_NAMES[pos.turn]
+        result = False
+        for move in pos.legal_moves():
+            undo = pos.make_move(move)
+            winner = pos.winner()
+            result = winner == mover or (winner is None and self.lose_in(pos, n - 1))
+            pos.unmake_move(move, undo)
+            if result:
+                break
+        self.cache[key] = result
+        return result
+
+    def lose_in(self, pos, n):
+        if n < 1:
+            return False
+        key = (pos.hash, n, False)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        self.nodes += 1
+        result = True
+        for move in pos.legal_moves():
+            undo = pos.make_move(move)
+            winner = pos.winner()
+            result = winner is None and self.win_in(pos, n - 1)
+            pos.unmake_move(move, undo)
+            if not result:
+                break
+        self.cache[key] = result
+        return result
+
+    def solve(self, pos, max_plies=TABLEBASE_PLIES):
+        # (distância, movimento): distância > 0 se o lado a jogar vence, < 0 se
+        # perde, e None se nada se decide em max_plies. Na vitória, o primeiro
+        # movimento (ordem de legal_moves) que vence na menor distância; na
+        # derrota, o que mais adia a derrota
+        if pos.winner() or pos.no_progress + max_plies >= DRAW_THRESHOLD:
+            return None, None
+        pos = pos.copy()
+        for n in range(1, max_plies + 1):
+            if self.win_in(pos, n):
+                for move in pos.legal_moves():
+                    undo = pos.make_move(move)
+                    wins = pos.winner() == SIDE_NAMES[pos.turn ^ 1] or (pos.winner() is None and self.lose_in(pos, n - 1))
+                    pos.unmake_move(move, undo)
+                    if wins:
+                        return n, move
+            if self.lose_in(pos, n):
+                best, best_move = -1, None
+                for move in pos.legal_moves():
+                    undo = pos.make_move(move)
+                    d = next(d for d in range(1, n) if self.win_in(pos, d))
+                    pos.unmake_move(move, undo)
+                    if d > best:
+                        best, best_move = d, move
+                return -n, best_move
+        return None, None
+
+class EndgameTablebase:
+    def __init__(self, max_plies=TABLEBASE_PLIES, symmetry=COLOR_MIRROR is not None):
+        self.max_plies = max_plies
+        self.symmetry = symmetry
+        self.entries = {} # chave -> (distância, código do movimento)
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _key(self, pos):
+        if self.symmetry and pos.mirror_hash < pos.hash:
+            return pos.mirror_hash, True
+        return pos.hash, False
+
+    def probe(self, pos):
+        # (distância, movimento) ou None; só vale longe do empate por no_progress
+        if pos.no_progress + self.max_plies >= DRAW_THRESHOLD:
+            return None
+        key, mirrored = self._key(pos)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        distance, code = entry
+        move = None
+        if code >= 0:
+            frm, to = divmod(code, 64)
+            if mirrored:
+                frm, to = frm ^ 7, to ^ 7
+            move = pos.rebase_move((0, frm, to))
+            if move is None: # Colisão de hash
+                return None
+        self.hits += 1
+        return distance, move
+
+    def add(self, pos, distance, move):
+        key, mirrored = self._key(pos)
+        code = -1
+        if move is not None:
+            code = move_code(move) ^ MIRROR_CODE if mirrored else move_code(move)
+        self.entries[key] = (distance, code)
+
+    def save(self, filename=TABLEBASE_FILE):
+        keys = np.array(sorted(self.entries), dtype=np.uint64)
+        header = json.dumps({'max_plies': self.max_plies, 'symmetry': self.symmetry, 'count': len(keys)}).encode()
+        with open(filename + '.tmp', 'wb') as f:
+            f.write(TABLEBASE_MAGIC + struct.pack('<I', len(header)) + header)
+            f.write(keys.tobytes())
+            f.write(np.array([self.entries[k][0] for k in keys.tolist()], dtype=TABLEBASE_DTYPES[1]).tobytes())
+            f.write(np.array([self.entries[k][1] for k in keys.tolist()], dtype=TABLEBASE_DTYPES[2]).tobytes())
+        os.replace(filename + '.tmp', filename)
+
+    @classmethod
+    def load(cls, filename=TABLEBASE_FILE):
+        with open(filename, 'rb') as f:
+            if f.read(4) != TABLEBASE_MAGIC:
+                raise ValueError(f"{filename} não é uma tabela de finais")
+            header = json.loads(f.read(struct.unpack('<I', f.read(4))[0]))
+            count = header['count']
+            arrays = [np.frombuffer(f.read(count * np.dtype(dt).itemsize), dtype=dt) for dt in TABLEBASE_DTYPES]
+        tb = cls(header['max_plies'], header['symmetry'])
+        tb.entries = dict(zip(arrays[0].tolist(), zip(arrays[1].tolist(), arrays[2].tolist())))
+        return tb
+
+_tablebases = {} # Tabelas já carregadas neste processo
+
+def load_tablebase(filename=TABLEBASE_FILE):
+    # A tabela do arquivo, ou None se ele não existir
+    if filename not in _tablebases:
+        _tablebases[filename] = EndgameTablebase.load(filename) if os.path.exists(filename) else None
+    return _tablebases[filename]
+
+def tablebase_positions(games, tail, seed=0):
+    # Posições dos últimos tail plies de partidas aleatórias e os seus filhos
+    rng = random.Random(seed)
+    seen, positions = set(), []
+    for i in range(games):
+        state = initial_state()
+        if i % 2:
+            state['turn'] = 'black'
+        pos = Position.from_dict(state)
+        history = []
+        while not pos.winner():
+            moves = pos.legal_moves()
+            if not moves:
+                break
+            history.append(pos.copy())
+            pos.make_move(rng.choice(moves))
+        for p in history[-tail:]:
+            for move in [None] + p.legal_moves():
+                child = p.copy()
+                if move is not None:
+                    child.make_move(move)
+                key = (position_signature(child), child.no_progress)
+                if key not in seen and not child.winner():
+                    seen.add(key)
+                    positions.append(child)
+    return positions
+
+def build_tablebase(filename=TABLEBASE_FILE, max_plies=TABLEBASE_PLIES, games=2000, tail=6, seed=0):
+    positions = tablebase_positions(games, tail, seed)
+    log_event(f"🏁 Gerando tabela de finais: {len(positions)} posições, até {max_plies} plies...",
+              'tablebase_start', positions=len(positions), max_plies=max_plies)
+    start_time = time.time()
+    tb = EndgameTablebase(max_plies)
+    solver = EndgameSolver()
+    for pos in positions:
+        if tb.probe(pos) is None:
+            distance, move = solver.solve(pos, max_plies)
+            if distance is not None:
+                tb.add(pos, distance, move)
+    tb.hits = 0
+    tb.save(filename)
+    _tablebases[filename] = tb # load_tablebase passa a devolver a tabela nova
+    log_event(f"💾 Tabela de finais salva: {len(tb)} posições resolvidas em {time.time() - start_time:.1f}s",
+              'tablebase_saved', file=filename, entries=len(tb), solver_nodes=solver.nodes,
+              elapsed_s=round(time.time() - start_time, 3))
+    return tb
+
+def tablebase_reward(tablebase, state, gamma=GAMMA):
+    # Reforço para o Q-Agent (pretas) ao chegar num final resolvido: a
+    # recompensa da vitória (ou da derrota) descontada pela distância até ela
+    entry = tablebase.probe(Position.from_dict(state))
+    if entry is None:
+        return 0.0
+    distance = entry[0]
+    sign = 1 if (distance > 0) == (state['turn'] == 'black') else -1
+    return sign * TABLEBASE_REWARD * gamma ** abs(distance)
+
+def verify_tablebase(tb, games=200, tail=6, seed=1):
+    # Confere as posições de partidas novas encontradas na tabela com o Minimax
+    # sem tabela: na distância d o resultado tem que aparecer (e o movimento
+    # guardado tem que mantê-lo), e em d - 1 ainda não. Devolve as divergências
+    mismatches, checked = [], 0
+    for pos in tablebase_positions(games, tail, seed):
+        entry = tb.probe(pos)
+        if entry is None:
+            continue
+        checked += 1
+        distance, move = entry
+        sign = 1 if (distance > 0) == (pos.turn == BLACK) else -1 # Valor do ponto de vista das pretas
+        d = abs(distance)
+        value, _ = position_minimax(pos.copy(), d, float('-inf'), float('inf'), pos.turn == BLACK, SearchContext())
+        shallow, _ = position_minimax(pos.copy(), d - 1, float('-inf'), float('inf'), pos.turn == BLACK, SearchContext())
+        child = pos.copy()
+        if move is None: # Derrota por falta de movimentos
+            after = sign * 1000 if not pos.legal_moves() else 0
+        elif child.make_move(move) and child.winner():
+            after = {'black': 1000, 'white': -1000}.get(child.winner(), 0)
+        else:
+            after, _ = position_minimax(child, d - 1, float('-inf'), float('inf'), child.turn == BLACK, SearchContext())
+        if value != sign * 1000 or abs(shallow) == 1000 or after != sign * 1000:
+            mismatches.append((pos.to_dict(), distance, move, value, shallow, after))
+    tb.hits -= checked
+    return mismatches, checked
+
+# Tabela de transposição
+TT_EXACT, TT_LOWER, TT_UPPER = 0, 1, 2
+
+class TranspositionTable:
+    # Tabela de tamanho fixo (2**size_log2 posições) indexada pelo hash de Zobrist.
+    # Cada entrada é (hash, profundidade, valor, tipo de limite, melhor movimento,
+    # geração). Substituição preferindo a maior profundidade, exceto para entradas
+    # de buscas anteriores, que sempre podem ser sobrescritas. Com symmetry, uma
+    # posição e a sua espelhada (COLOR_MIRROR) compartilham a entrada.
+    def __init__(self, size_log2=20, symmetry=False):
+        if symmetry and COLOR_MIRROR is None:
+            raise ValueError("O tabuleiro não tem a simetria de espelhamento")
+        self.mask = (1 << size_log2) - 1
+        self.table = [None] * (self.mask + 1)
+        self.generation = 0
+        self.symmetry = symmetry
+
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        entry = self.table[key & self.mask]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, move):
+        idx = key & self.mask
+        old = self.table[idx]
+        if old is None or old[5] != self.generation or depth >= old[1]:
+            self.table[idx] = (key, depth, value, flag, move, self.generation)
+
+    def clear(self):
+        self.table = [None] * (self.mask + 1)
+        self.generation = 0
+
+class SearchAborted(Exception):
+    pass
+
+class SearchContext:
+    # Estado compartilhado por uma busca: tabela de transposição, contador de
+    # nós, prazo opcional (time.perf_counter()) para a busca com tempo limitado
+    # e, com ordering, as tabelas de killers (por profundidade restante) e de
+    # histórico (por lado e origem*64+destino) usadas para ordenar os movimentos.
+    # Com tablebase, as posições resolvidas da tabela de finais não são buscadas.
+    # cancel (threading.Event) interrompe a busca com SearchAborted, como o prazo
+    __slots__ = ('tt', 'nodes', 'deadline', 'ordering', 'killers', 'history', 'tablebase', 'tb_hits', 'cancel')
+
+    def __init__(self, tt=None, deadline=None, ordering=False, killers=None, history=None, tablebase=None,
+                 cancel=None):
+        self.tt = tt
+        self.tablebase = tablebase
+        self.cancel = cancel
+        self.tb_hits = 0
+        self.nodes = 0
+        self.deadline = deadline
+        self.ordering = ordering
+        self.killers = killers if killers is not None else new_killer_table()
+        self.history = history if history is not None else new_history_table()
+
+# Ordenação de movimentos
+MAX_ID_DEPTH = 64 # Limite de segurança do aprofundamento iterativo
+
+def new_killer_table():
+    return [[None, None] for _ in range(MAX_ID_DEPTH + 1)]
+
+def new_history_table():
+    return [[0] * 4096, [0] * 4096]
+
+def order_moves(pos, moves, tt_move, ctx, depth):
+    # Vitórias imediatas (chegar à linha de base adversária) primeiro, depois o
+    # movimento da tabela de transposição, os killers desta profundidade e por
+    # fim histórico menos o número de respostas do adversário: a cor da casa de
+    # destino decide quais peças ele pode mover. sort é estável: empates
+    # mantêm a ordem de legal_moves()
+    side = pos.turn
+    opp = side ^ 1
+    home = HOME_ROW_MASK[side]
+    history = ctx.history[side]
+    killers = ctx.killers[depth]
+    tt_key = (tt_move[1], tt_move[2]) if tt_move is not None else None
+    occupied = pos.bitboards[WHITE] | pos.bitboards[BLACK]
+    opp_squares = pos.squares[opp]
+    opp_rays = RAYS[opp]
+
+    def score(move):
+        _, frm, to = move
+        if home >> to & 1:
+            return 1 << 40
+        key = (frm, to)
+        if key == tt_key:
+            return 1 << 39
+        if key == killers[0] or key == killers[1]:
+            return 1 << 38
+        replies = count_moves(opp_squares, opp_rays, SQUARE_COLOR[to], occupied ^ (1 << frm) ^ (1 << to))
+        return history[frm*64 + to] * 8 - replies * 16
+
+    moves.sort(key=score, reverse=True)
+    return moves
+
+def record_cutoff(ctx, pos, move, depth):
+    # Atualiza killers e histórico com o movimento que causou a poda
+    _, frm, to = move
+    if HOME_ROW_MASK[pos.turn] >> to & 1:
+        return
+    killers = ctx.killers[depth]
+    if killers[0] != (frm, to):
+        killers[1] = killers[0]
+        killers[0] = (frm, to)
+    ctx.history[pos.turn][frm*64 + to] += depth * depth
+
 # Algoritmo Minimax com poda alpha-beta
-def minimax_search(state, depth, alpha, beta, maximizing):
-    winner = game_over(state)
+def minimax_search(state, depth, alpha, beta, maximizing, tt=None, ctx=None):
+    pos = Position.from_dict(state)
+    value, move = position_minimax(pos, depth, alpha, beta, maximizing, ctx or SearchContext(tt))
+    if move is None:
+        return value, state
+    return value, pos.child_dict(move)
+
+def position_minimax(pos, depth, alpha, beta, maximizing, ctx):
+    # Retorna (valor, movimento) sobre o Position, desfazendo cada jogada.
+    # Com ctx.tt, pressupõe maximizing == (pos.turn == BLACK), como em MinimaxAgent.
+    ctx.nodes += 1
+    if not ctx.nodes & 1023 and (ctx.deadline is not None and time.perf_counter() > ctx.deadline or
+                                 ctx.cancel is not None and ctx.cancel.is_set()):
+        raise SearchAborted()
+
+    winner = pos.winner()
     if winner:
-        if winner == 'black': return 1000, state
-        elif winner == 'white': return -1000, state
-        else: return 0, state
+        if winner == 'black': return 1000, None
+        elif winner == 'white': return -1000, None
+        else: return 0, None
 
-    if depth == 0:
-        return advanced_heuristic(state), state
+    if ctx.tablebase is not None:
+        entry = ctx.tablebase.probe(pos)
+        if entry is not None:
+            ctx.tb_hits += 1
+            return (1000 if (entry[0] > 0) == (pos.turn == BLACK) else -1000), entry[1]
 
-    moves = successors(state)
+    if depth == 0:
+        return position_heuristic(pos), None
+
+    # A entrada só vale se nenhum empate por no_progress couber no horizonte,
+    # e só para a mesma profundidade, para o valor ser o mesmo da busca sem tabela
+    tt = ctx.tt
+    use_tt = tt is not None and pos.no_progress + depth < DRAW_THRESHOLD
+    tt_move = None
+    if use_tt:
+        # Na tabela simétrica a chave é o menor dos dois hashes e o movimento é
+        # guardado no referencial dessa chave
+        key, mirrored = pos.hash, False
+        if tt.symmetry and pos.mirror_hash < key:
+            key, mirrored = pos.mirror_hash, True
+        entry = tt.probe(key)
+        if entry is not None:
+            if entry[4] is not None:
+                move = entry[4]
+                tt_move = pos.rebase_move((move[0], move[1] ^ 7, move[2] ^ 7) if mirrored else move)
+            if entry[1] == depth:
+                value, flag = entry[2], entry[3]
+                if flag == TT_EXACT or (flag == TT_LOWER and value >= beta) or (flag == TT_UPPER and value <= alpha):
+                    return value, tt_move
+
+    moves = pos.legal_moves()
     if not moves:
-        return (-1000 if maximizing else 1000), state
+        return (-1000 if maximizing else 1000), None
+
+    if ctx.ordering:
+        order_moves(pos, moves, tt_move, ctx, depth)
+    elif tt_move is not None and tt_move in moves:
+        moves.remove(tt_move)
+        moves.insert(0, tt_move)
+    alpha_orig, beta_orig = alpha, beta
 
     if maximizing:
-        max_eval = float('-inf')
+        best_val = float('-inf')
         best_move = None
 
         for move in moves:
-            eval_val, _ = minimax_search(move, depth-1, alpha, beta, False)
-            if eval_val > max_eval:
-                max_eval = eval_val
+            undo = pos.make_move(move)
+            eval_val, _ = position_minimax(pos, depth-1, alpha, beta, False, ctx)
+            pos.unmake_move(move, undo)
+            if eval_val > best_val:
+                best_val = eval_val
                 best_move = move
             alpha = max(alpha, eval_val)
             if beta <= alpha:
+                if ctx.ordering: record_cutoff(ctx, pos, move, depth)
                 break
-        return max_eval, best_move
 
     else:
-        min_eval = float('inf')
+        best_val = float('inf')
         best_move = None
 
         for move in moves:
-            eval_val, _ = minimax_search(move, depth-1, alpha, beta, True)
-            if eval_val < min_eval:
-                min_eval = eval_val
+            undo = pos.make_move(move)
+            eval_val, _ = position_minimax(pos, depth-1, alpha, beta, True, ctx)
+            pos.unmake_move(move, undo)
+            if eval_val < best_val:
+                best_val = eval_val
                 best_move = move
             beta = min(beta, eval_val)
             if beta <= alpha:
+                if ctx.ordering: record_cutoff(ctx, pos, move, depth)
                 break
-        return min_eval, best_move
 
-class MinimaxAgent:
+    if use_tt:
+        if best_val <= alpha_orig:
+            flag = TT_UPPER
+        elif best_val >= beta_orig:
+            flag = TT_LOWER
+        else:
+            flag = TT_EXACT
+        if mirrored:
+            best_move_key = (best_move[0], best_move[1] ^ 7, best_move[2] ^ 7)
+        else:
+            best_move_key = best_move
+        tt.store(key, depth, best_val, flag, best_move_key)
+    return best_val, best_move
+
+# Busca paralela pela raiz
+#
+# Os filhos da raiz são distribuídos entre os processos de um pool, cada um com
+# o seu MinimaxAgent (tabela de transposição, killers e histórico próprios).
+# O melhor valor já encontrado, do ponto de vista de quem joga na raiz, fica
+# num Array compartilhado junto com o número da busca: cada filho é buscado
+# com a janela aberta logo abaixo dele (os valores são inteiros), então um
+# filho tão bom quanto o melhor tem o valor exato e um pior só é descartado.
+# O desempate é o da busca serial de um agente zerado: o primeiro na ordem da
+# raiz entre os de melhor valor.
+
+_minimax_worker = {} # Minimax de cada processo do pool e o limite compartilhado
+MINIMAX_POLL_SECONDS = 0.05 # Intervalo em que a busca paralela confere o cancelamento
+
+class _StaleGeneration:
+    # Faz o papel do Event cancel do SearchContext nos processos do pool: a
+    # busca de um filho é abandonada quando o número da busca muda
+    def __init__(self, shared, generation):
+        self.shared, self.generation = shared, generation
+
+    def is_set(self):
+        return self.shared[0] != self.generation
+
+def _init_minimax_worker(config, tablebase, shared):
+    _minimax_worker['agent'] = MinimaxAgent(**config, tablebase=tablebase)
+    _minimax_worker['shared'] = shared
+    _minimax_worker['generation'] = None
+
+def _minimax_worker_search(task):
+    # Devolve (índice do movimento, valor para quem joga na raiz ou None se ele
+    # ficou abaixo do melhor ou a busca foi cancelada, nós, acertos na tabela de finais)
+    state, move, index, depth, generation = task
+    agent, shared = _minimax_worker['agent'], _minimax_worker['shared']
+    with shared.get_lock():
+        if shared[0] != generation: # Busca cancelada
+            return index, None, 0, 0
+        alpha = shared[1] - 1
+    if _minimax_worker['generation'] != generation:
+        _minimax_worker['generation'] = generation
+        agent._new_search()
+    pos = Position.from_dict(state)
+    maximizing = pos.turn == BLACK
+    pos.make_move(move)
+    ctx = agent._new_context()
+    ctx.cancel = _StaleGeneration(shared, generation)
+    try:
+        if maximizing:
+            score, _ = position_minimax(pos, depth - 1, alpha, float('inf'), False, ctx)
+        else:
+            value, _ = position_minimax(pos, depth - 1, float('-inf'), -alpha, True, ctx)
+            score = -value
+    except SearchAborted:
+        return index, None, ctx.nodes, ctx.tb_hits
+    if score <= alpha:
+        score = None
+    else:
+        with shared.get_lock():
+            if shared[0] == generation and score > shared[1]:
+                shared[1] = score
+    return index, score, ctx.nodes, ctx.tb_hits
 
-    def __init__(self, depth=3):
+class MinimaxAgent:
+    # Com time_ms, faz aprofundamento iterativo até o tempo acabar em vez de
+    # buscar na profundidade fixa. last_search guarda profundidade, nós e tempo.
+    # ordering=False desliga a ordenação de movimentos (útil para comparar nós).
+    # Com tablebase (EndgameTablebase), os finais resolvidos saem da tabela; os
+    # valores mudam em relação à busca sem ela, então o livro não é consultado.
+    # workers > 1 faz a busca de profundidade fixa pela raiz num pool de
+    # processos, com o mesmo resultado da busca serial de um agente zerado
+    # (dentro de outro pool, como em train_parallel, a busca é serial).
+
+    def __init__(self, depth=3, tt_size_log2=20, time_ms=None, ordering=True, symmetry=False, book=None,
+                 tablebase=None, workers=1):
         self.depth = depth
+        self.workers = workers
+        self.pool = None
+        self.shared = None # [número da busca, melhor valor] dos processos do pool
+        self.tablebase = tablebase
+        self.cancel = None # threading.Event que interrompe a busca em andamento (SearchAborted)
+        self.time_ms = time_ms
+        self.ordering = ordering
+        # Mantidos entre jogadas e entre episódios enquanto o agente viver
+        self.tt = TranspositionTable(tt_size_log2, symmetry)
+        self.killers = new_killer_table()
+        self.history = new_history_table()
+        self.last_search = {'depth': 0, 'nodes': 0, 'time_ms': 0.0, 'book': False, 'tb_hits': 0}
+        # Livro de aberturas (OpeningBook), consultado nas buscas de profundidade fixa
+        if book is not None and not book.matches(self):
+            raise ValueError("Livro de aberturas gerado com outra configuração de Minimax")
+        self.book = book
+        self.training_mode = False # Mesma interface do QLearningAgent em play_vs_agent
+        self.epsilon = 0.0
+
+    def __getstate__(self):
+        # O pool de processos fica só no processo original
+        state = self.__dict__.copy()
+        state['pool'] = state['shared'] = None
+        return state
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def reset(self):
+        # Esquece tudo o que foi aprendido em buscas anteriores
+        self.tt.clear()
+        self.killers = new_killer_table()
+        self.history = new_history_table()
+
+    def _new_context(self, deadline=None):
+        return SearchContext(self.tt, deadline, self.ordering, self.killers, self.history, self.tablebase, self.cancel)
+
+    def _new_search(self):
+        self.tt.new_search()
+        # Envelhece o histórico para que buscas antigas não dominem a ordenação
+        for table in self.history:
+            for i, h in enumerate(table):
+                if h: table[i] = h >> 1
+
+    def search_position(self, pos):
+        # Busca de profundidade fixa; devolve (valor, movimento, contexto)
+        if self.workers > 1 and not multiprocessing.current_process().daemon:
+            return self._parallel_search(pos)
+        self._new_search()
+        ctx = self._new_context()
+        value, move = position_minimax(pos.copy(), self.depth, float('-inf'), float('inf'), pos.turn == BLACK, ctx)
+        return value, move, ctx
 
     def choose_action(self, state, possible_moves):
         if not possible_moves:
             return None
-        _, move = minimax_search(state, self.depth, float('-inf'), float('inf'), state['turn'] == 'black')
-        return move
+        start = time.perf_counter()
+        pos = Position.from_dict(state)
+        if self.time_ms is None:
+            move = self.book.probe(pos, self.depth) if self.book is not None and self.tablebase is None else None
+            if move is not None:
+                self.last_search = {'depth': self.depth, 'nodes': 0, 'book': True, 'tb_hits': 0,
+                                    'time_ms': (time.perf_counter() - start) * 1000}
+                return pos.child_dict(move)
+            _, move, ctx = self.search_position(pos)
+            child = state if move is None else pos.child_dict(move)
+            depth = self.depth
+        else:
+            self._new_search()
+            child, depth, ctx = self._iterative_deepening(state, start + self.time_ms / 1000)
+        self.last_search = {'depth': depth, 'nodes': ctx.nodes, 'book': False, 'tb_hits': ctx.tb_hits,
+                            'time_ms': (time.perf_counter() - start) * 1000}
+        return child
+
+    def start_pool(self):
+        if self.pool is None:
+            self.shared = multiprocessing.Array('d', [0.0, float('-inf')])
+            config = {'depth': self.depth, 'tt_size_log2': self.tt.mask.bit_length(), 'ordering': self.ordering,
+                      'symmetry': self.tt.symmetry}
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_minimax_worker,
+                                             initargs=(config, self.tablebase, self.shared))
+        return self.pool
+
+    def _parallel_search(self, pos):
+        # Mesma interface de search_position; veja _minimax_worker_search
+        maximizing = pos.turn == BLACK
+        moves = pos.legal_moves()
+        if self.depth < 2 or pos.winner() or not moves or (self.tablebase is not None and
+                                                           self.tablebase.probe(pos) is not None):
+            # Raiz resolvida sem busca, ou rasa demais para dividir
+            ctx = SearchContext(None, None, self.ordering, tablebase=self.tablebase)
+            value, move = position_minimax(pos.copy(), self.depth, float('-inf'), float('inf'), maximizing, ctx)
+            return value, move, ctx
+        if self.ordering: # A ordem da raiz de um agente zerado
+            order_moves(pos, moves, None, SearchContext(ordering=True), self.depth)
+
+        pool = self.start_pool()
+        with self.shared.get_lock():
+            self.shared[0] += 1
+            self.shared[1] = float('-inf')
+            generation = self.shared[0]
+        state = pos.to_dict()
+        tasks = [(state, move, i, self.depth, generation) for i, move in enumerate(moves)]
+        # O primeiro filho (o mais promissor) é buscado antes dos outros, para
+        # que eles já comecem com o limite dele. Enquanto espera, confere o
+        # cancel a cada MINIMAX_POLL_SECONDS
+        first = pool.apply_async(_minimax_worker_search, (tasks[0],))
+        while not first.ready():
+            self._check_cancel()
+            first.wait(MINIMAX_POLL_SECONDS)
+        results = [first.get()]
+        pending = pool.imap_unordered(_minimax_worker_search, tasks[1:])
+        while len(results) < len(tasks):
+            self._check_cancel()
+            try:
+                results.append(pending.next(MINIMAX_POLL_SECONDS))
+            except multiprocessing.TimeoutError:
+                pass
+
+        ctx = SearchContext()
+        ctx.nodes = 1
+        best_index, best_score = None, float('-inf')
+        for index, score, nodes, tb_hits in results:
+            ctx.nodes += nodes
+            ctx.tb_hits += tb_hits
+            if score is not None and (score > best_score or score == best_score and index < best_index):
+                best_index, best_score = index, score
+        return (best_score if maximizing else -best_score), moves[best_index], ctx
+
+    def _check_cancel(self):
+        # Cancela a busca paralela: o novo número de busca faz os processos
+        # abandonarem os filhos em andamento e pularem os que estão na fila
+        if self.cancel is not None and self.cancel.is_set():
+            with self.shared.get_lock():
+                self.shared[0] += 1
+            raise SearchAborted()
+
+    def _iterative_deepening(self, state, deadline):
+        pos = Position.from_dict(state)
+        ctx = self._new_context(deadline)
+        if pos.winner():
+            return state, 0, ctx
+        maximizing = pos.turn == BLACK
+        moves = pos.legal_moves()
+        if self.ordering:
+            order_moves(pos, moves, None, ctx, 0)
+        best_move, reached = moves[0], 0
+        for depth in range(1, MAX_ID_DEPTH + 1):
+            result = [None, None]
+            try:
+                self._search_root(pos, depth, maximizing, ctx, moves, result)
+            except SearchAborted:
+                # A iteração incompleta começou pelo melhor movimento anterior,
+                # então o que ela achou até aqui é pelo menos tão bom quanto ele
+                if result[1] is not None:
+                    best_move = result[1]
+                break
+            best_move, reached = result[1], depth
+            # O melhor movimento desta iteração abre a próxima
+            moves.remove(best_move)
+            moves.insert(0, best_move)
+            if time.perf_counter() > deadline or abs(result[0]) == 1000: # tempo esgotado ou resultado decidido
+                break
+        return pos.child_dict(best_move), reached, ctx
+
+    def _search_root(self, pos, depth, maximizing, ctx, moves, result):
+        # result = [valor, movimento], atualizado a cada filho concluído.
+        # Cada filho é buscado numa cópia para que um aborto não deixe pos pela metade
+        ctx.nodes += 1
+        alpha, beta = float('-inf'), float('inf')
+        for move in moves:
+            child = pos.copy()
+            child.make_move(move)
+            eval_val, _ = position_minimax(child, depth-1, alpha, beta, not maximizing, ctx)
+            if result[1] is None or (eval_val > result[0] if maximizing else eval_val < result[0]):
+                result[0], result[1] = eval_val, move
+            if maximizing:
+                alpha = max(alpha, eval_val)
+            else:
+                beta = min(beta, eval_val)
+
+# Livro de aberturas
+#
+# Todas as partidas saem de initial_state(), então as primeiras posições são
+# buscadas de novo a cada episódio. O livro guarda, para cada (hash, profundidade)
+# das posições dos primeiros plies, o valor e o movimento de uma busca feita por
+# um MinimaxAgent zerado com a mesma configuração. Cada entrada guarda também a
+# posição completa, conferida na consulta: os rótulos das peças não entram no
+# hash, mas mudam a ordem dos movimentos e portanto o desempate.
+
+OPENING_BOOK_FILE = 'kamisado_opening_book.json'
+OPENING_BOOK_PLIES = 2
+
+def position_signature(pos):
+    return (tuple(pos.squares[WHITE]), tuple(pos.squares[BLACK]), pos.turn, pos.next_color)
+
+class OpeningBook:
+    def __init__(self, tt_size_log2=20, ordering=True, symmetry=False):
+        self.config = {'tt_size_log2': tt_size_log2, 'ordering': ordering, 'symmetry': symmetry}
+        self.entries = {} # (hash, profundidade) -> (posição, valor, movimento)
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def matches(self, agent):
+        # O desempate depende da configuração do agente, então o livro só serve
+        # para a mesma com que foi gerado
+        return self.config == {'tt_size_log2': agent.tt.mask.bit_length(), 'ordering': agent.ordering,
+                               'symmetry': agent.tt.symmetry}
+
+    def probe(self, pos, depth):
+        # Movimento da busca sem cache, ou None se a posição não estiver no livro.
+        # Perto do empate por no_progress o valor pode mudar, então não vale
+        if pos.no_progress + depth >= DRAW_THRESHOLD:
+            return None
+        entry = self.entries.get((pos.hash, depth))
+        if entry is None or entry[0] != position_signature(pos):
+            return None
+        self.hits += 1
+        return entry[2]
+
+    def add(self, pos, depth, value, move):
+        self.entries.setdefault((pos.hash, depth), (position_signature(pos), value, move))
+
+    def save(self, filename=OPENING_BOOK_FILE):
+        entries = [[list(white), list(black), turn, next_color, depth, value, list(move)]
+                   for (_, depth), ((white, black, turn, next_color), value, move) in self.entries.items()]
+        with open(filename + '.tmp', 'w') as f:
+            json.dump({'config': self.config, 'entries': entries}, f)
+        os.replace(filename + '.tmp', filename)
+
+    @classmethod
+    def load(cls, filename=OPENING_BOOK_FILE):
+        with open(filename) as f:
+            data = json.load(f)
+        book = cls(**data['config'])
+        for white, black, turn, next_color, depth, value, move in data['entries']:
+            book.add(Position([white, black], turn, next_color), depth, value, tuple(move))
+        return book
+
+_opening_books = {} # Livros já carregados neste processo
+
+def load_opening_book(filename=OPENING_BOOK_FILE):
+    # Livro do arquivo (lido uma vez por processo), ou None se ele não existir
+    if filename not in _opening_books:
+        _opening_books[filename] = OpeningBook.load(filename) if os.path.exists(filename) else None
+    return _opening_books[filename]
+
+def opening_positions(plies):
+    # Posições não terminais e com movimentos até plies jogadas, começando por
+    # qualquer um dos lados (em evaluate() as pretas começam nos jogos pares)
+    start = initial_state()
+    frontier = [Position.from_dict(dict(start, turn=side)) for side in SIDE_NAMES]
+    seen = set()
+    positions = []
+    for ply in range(plies + 1):
+        next_frontier = []
+        for pos in frontier:
+            signature = position_signature(pos)
+            if signature in seen or pos.winner():
+                continue
+            seen.add(signature)
+            moves = pos.legal_moves()
+            if not moves:
+                continue
+            positions.append(pos)
+            if ply < plies:
+                for move in moves:
+                    child = pos.copy()
+                    child.make_move(move)
+                    next_frontier.append(child)
+        frontier = next_frontier
+    return positions
+
+def build_opening_book(filename=OPENING_BOOK_FILE, plies=OPENING_BOOK_PLIES, depths=(1, 2, 3),
+                       tt_size_log2=20, ordering=True, symmetry=False):
+    positions = opening_positions(plies)
+    log_event(f"📖 Gerando livro de aberturas: {len(positions)} posições, profundidades {list(depths)}...",
+              'book_start', positions=len(positions), depths=list(depths))
+    start_time = time.time()
+    book = OpeningBook(tt_size_log2, ordering, symmetry)
+    agent = MinimaxAgent(tt_size_log2=tt_size_log2, ordering=ordering, symmetry=symmetry)
+    for depth in depths:
+        agent.depth = depth
+        for pos in positions:
+            agent.reset()
+            value, move, _ = agent.search_position(pos)
+            book.add(pos, depth, value, move)
+    book.save(filename)
+    _opening_books.pop(filename, None)
+    log_event(f"💾 Livro salvo: {len(book)} entradas em {time.time() - start_time:.1f}s", 'book_saved',
+              file=filename, entries=len(book), elapsed_s=round(time.time() - start_time, 3))
+    return book
+
+def verify_opening_book(book, sample=None, seed=0):
+    # Refaz a busca sem cache de cada entrada (ou de uma amostra) e devolve as
+    # entradas cujo valor ou movimento não confere
+    items = list(book.entries.items())
+    if sample is not None and sample < len(items):
+        items = random.Random(seed).sample(items, sample)
+    agent = MinimaxAgent(**book.config)
+    mismatches = []
+    for (_, depth), ((white, black, turn, next_color), value, move) in items:
+        agent.depth = depth
+        agent.reset()
+        pos = Position([list(white), list(black)], turn, next_color)
+        if agent.search_position(pos)[:2] != (value, move):
+            mismatches.append((pos, depth))
+    return mismatches
+
+# Instrumentação
+#
+# Contadores e tempos acumulados das funções do laço de jogo, nós por busca do
+# Minimax, acertos da Q-table e tamanho dela ao longo do treino. enable() troca
+# as funções e métodos medidos por versões que medem e disable() devolve os
+# originais, então desligada ela não custa nada. Só o processo atual é medido
+# (nos treinos e avaliações paralelos, o trabalho dos outros processos fica de fora).
+# As medidas aninhadas se sobrepõem (save inclui o tempo de QTable.save, por exemplo).
+
+# A busca do MinimaxAgent é medida por chamada (search_position na profundidade
+# fixa, _iterative_deepening com tempo); position_minimax é recursiva e não é
+# medida, mas position_heuristic conta as folhas avaliadas.
+_INSTRUMENTED_FUNCTIONS = ('successors', 'advanced_heuristic', 'position_heuristic')
+_INSTRUMENTED_METHODS = (('MinimaxAgent', 'search_position'), ('MinimaxAgent', '_iterative_deepening'),
+                         ('QLearningAgent', 'choose_action'), ('QLearningAgent', 'update_encoded'),
+                         ('QLearningAgent', '_flush_wal'), ('QLearningAgent', '_compact'),
+                         ('QLearningAgent', 'save'))
+
+class Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self._originals = [] # (objeto, nome, original) para desfazer a troca
+        self.timers = {} # nome -> [chamadas, segundos]
+        self.counters = {}
+        self.series = [] # Uma amostra por relatório
+        self._start = time.perf_counter()
+
+    def reset(self):
+        # Zera as medidas no lugar (os wrappers guardam referências às listas)
+        for stats in self.timers.values():
+            stats[0], stats[1] = 0, 0.0
+        for name in self.counters:
+            self.counters[name] = 0
+        self.series = []
+        self._start = time.perf_counter()
+
+    def _timer(self, name):
+        return self.timers.setdefault(name, [0, 0.0])
+
+    def _patch(self, owner, name, wrapper):
+        original = owner[name] if isinstance(owner, dict) else getattr(owner, name)
+        self._originals.append((owner, name, original))
+        if isinstance(owner, dict):
+            owner[name] = wrapper(original)
+        else:
+            setattr(owner, name, wrapper(original))
+
+    def _timed(self, label):
+        stats = self._timer(label)
+        perf_counter = time.perf_counter
+        def wrap(fn):
+            def timed(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    stats[0] += 1
+                    stats[1] += perf_counter() - start
+            return timed
+        return wrap
+
+    def enable(self):
+        if self.enabled:
+            return
+        module = globals()
+        for name in _INSTRUMENTED_FUNCTIONS:
+            self._patch(module, name, self._timed(name))
+        for cls_name, name in _INSTRUMENTED_METHODS:
+            self._patch(module[cls_name], name, self._timed(f'{cls_name}.{name}'))
+        self._patch(MinimaxAgent, 'choose_action', self._minimax_wrapper)
+        self._patch(QTable, 'get', self._q_get_wrapper)
+        self._patch(QTable, 'get_many', self._q_get_many_wrapper)
+        self.enabled = True
+
+    def disable(self):
+        for owner, name, original in reversed(self._originals):
+            if isinstance(owner, dict):
+                owner[name] = original
+            else:
+                setattr(owner, name, original)
+        self._originals = []
+        self.enabled = False
+
+    def _count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _minimax_wrapper(self, fn):
+        timed = self._timed('MinimaxAgent.choose_action')(fn)
+        def choose_action(agent, state, possible_moves):
+            child = timed(agent, state, possible_moves)
+            if possible_moves:
+                nodes = agent.last_search['nodes']
+                self._count('minimax.searches')
+                self._count('minimax.nodes', nodes)
+                self._count('minimax.book_hits', agent.last_search.get('book', False))
+                self.counters['minimax.max_nodes'] = max(self.counters.get('minimax.max_nodes', 0), nodes)
+            return child
+        return choose_action
+
+    def _q_get_wrapper(self, fn):
+        timed = self._timed('QTable.get')(fn)
+        missing = object()
+        def get(table, key, default=0.0):
+            value = timed(table, key, missing)
+            if value is missing:
+                self._count('q.misses')
+                return default
+            self._count('q.hits')
+            return value
+        return get
+
+    def _q_get_many_wrapper(self, fn):
+        timed = self._timed('QTable.get_many')(fn)
+        def get_many(table, w, b, x, default=0.0):
+            values = timed(table, w, b, x, np.nan)
+            missing = np.isnan(values)
+            n_missing = int(missing.sum())
+            self._count('q.misses', n_missing)
+            self._count('q.hits', len(values) - n_missing)
+            values[missing] = default
+            return values
+        return get_many
+
+    def summary(self, agent=None):
+        # Medidas atuais num dicionário (o mesmo que vai para o JSON)
+        hits, misses = self.counters.get('q.hits', 0), self.counters.get('q.misses', 0)
+        searches = self.counters.get('minimax.searches', 0)
+        return {
+            'elapsed_s': time.perf_counter() - self._start,
+            'timers': {name: {'calls': calls, 'seconds': seconds, 'mean_us': seconds / calls * 1e6 if calls else 0.0}
+                       for name, (calls, seconds) in self.timers.items()},
+            'counters': dict(self.counters),
+            'q_hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'minimax_nodes_per_search': self.counters.get('minimax.nodes', 0) / searches if searches else 0.0,
+            'q_table_size': len(agent.q_table) if agent is not None else None,
+        }
+
+    def report(self, agent=None, episode=None):
+        # Linha para acompanhar a linha de progresso do treino; guarda a amostra na série
+        summary = self.summary(agent)
+        self.series.append({'episode': episode, 'elapsed_s': summary['elapsed_s'],
+                            'q_table_size': summary['q_table_size'], 'q_hit_rate': summary['q_hit_rate'],
+                            'minimax_nodes_per_search': summary['minimax_nodes_per_search'],
+                            'seconds': {name: t['seconds'] for name, t in summary['timers'].items()}})
+        parts = [f"{name} {t['calls']}x {t['seconds']:.2f}s" for name, t in summary['timers'].items() if t['calls']]
+        parts.append(f"Q hit {summary['q_hit_rate']:.1%}")
+        parts.append(f"nós/busca {summary['minimax_nodes_per_search']:.0f}")
+        if summary['q_table_size'] is not None:
+            parts.append(f"Q-table {summary['q_table_size']}")
+        return "⏱️ " + " | ".join(parts)
+
+    def log(self, agent=None, episode=None):
+        # report() como mensagem de progresso (com LOG_FORMAT = 'json', a última amostra da série)
+        line = self.report(agent, episode)
+        log_event(line, 'instrumentation', **self.series[-1])
+
+    def export_json(self, filename, agent=None):
+        with open(filename, 'w') as f:
+            json.dump({'summary': self.summary(agent), 'series': self.series}, f, indent=2)
+
+    def export_csv(self, filename):
+        # A série (uma linha por relatório), com os segundos acumulados de cada função
+        names = sorted({name for sample in self.series for name in sample['seconds']})
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['episode', 'elapsed_s', 'q_table_size', 'q_hit_rate', 'minimax_nodes_per_search'] +
+                            [f'{name}_s' for name in names])
+            for sample in self.series:
+                writer.writerow([sample['episode'], f"{sample['elapsed_s']:.3f}", sample['q_table_size'],
+                                 f"{sample['q_hit_rate']:.4f}", f"{sample['minimax_nodes_per_search']:.1f}"] +
+                                [f"{sample['seconds'].get(name, 0.0):.4f}" for name in names])
+
+INSTRUMENTATION = Instrumentation()
+
+def minimax_curriculum_depth(ep, curriculum=None):
+    # Currículo de profundidade para o Minimax (mais gradual): por padrão a
+    # profundidade 1 vai até o episódio 3000, a 2 até o 8000 e a 3 fica só
+    # nos últimos 20% do treinamento (se for 10k episódios)
+    curriculum = curriculum or MINIMAX_CURRICULUM
+    depth = curriculum[0][1]
+    for start, step_depth in curriculum:
+        if ep >= start:
+            depth = step_depth
+    return depth
+
+def parse_curriculum(text):
+    # "0:1,3000:2,8000:3" -> ((0, 1), (3000, 2), (8000, 3))
+    steps = []
+    for part in text.split(','):
+        start, depth = part.split(':')
+        steps.append((int(start), int(depth)))
+    if not steps or any(depth < 1 for _, depth in steps):
+        raise ValueError(f"Currículo inválido: {text!r}")
+    return tuple(sorted(steps))
+
+# Currículo do Minimax: o laço de treino pede a profundidade de cada episódio
+# com depth(ep) e devolve o vencedor da partida com record(depth, winner).
+# O vencedor vem de play_minimax_episode ('black' é o Q-Agent): agent.stats
+# só registra as partidas que terminam com uma jogada do Q-Agent
+
+class FixedCurriculum:
+    # Profundidade só pelo número do episódio (degraus como MINIMAX_CURRICULUM)
+    def __init__(self, steps=None):
+        self.steps = tuple(steps or MINIMAX_CURRICULUM)
+
+    def depth(self, ep):
+        return minimax_curriculum_depth(ep, self.steps)
+
+    def record(self, depth, winner):
+        pass
+
+    def describe(self):
+        return {'curriculum': 'fixed'}
+
+class AdaptiveCurriculum:
+    # Sobe para a próxima profundidade quando a taxa de vitórias do Q-Agent nas
+    # últimas window partidas da profundidade atual chega a promote (e desce se
+    # cair abaixo de demote). Com mix > 0, essa fração dos episódios usa uma
+    # profundidade já superada, sorteada; essas partidas de revisão não entram
+    # na taxa. O sorteio tem gerador próprio para não mexer em random.
+    def __init__(self, depths=(1, 2, 3), window=200, promote=0.5, demote=None, mix=0.0, seed=0):
+        if not depths or window < 1:
+            raise ValueError("Currículo adaptativo precisa de profundidades e window >= 1")
+        self.depths = tuple(depths)
+        self.window, self.promote, self.demote, self.mix = window, promote, demote, mix
+        self.level = 0
+        self.results = deque(maxlen=window)
+        self.rng = random.Random(seed)
+
+    @property
+    def current_depth(self):
+        return self.depths[self.level]
+
+    def win_rate(self):
+        return sum(self.results) / len(self.results) if self.results else 0.0
+
+    def depth(self, ep):
+        if self.mix and self.level and self.rng.random() < self.mix:
+            return self.depths[self.rng.randrange(self.level)]
+        return self.current_depth
+
+    def record(self, depth, winner):
+        if depth != self.current_depth:
+            return
+        self.results.append(1 if winner == 'black' else 0)
+        if len(self.results) < self.window:
+            return
+        rate = self.win_rate()
+        if rate >= self.promote and self.level + 1 < len(self.depths):
+            self._change_level(+1, rate)
+        elif self.demote is not None and rate < self.demote and self.level > 0:
+            self._change_level(-1, rate)
+
+    def _change_level(self, step, rate):
+        old = self.current_depth
+        self.level += step
+        self.results.clear()
+        log_event(f"📈 Currículo: Minimax {old} -> {self.current_depth} (vitórias {rate:.1%} nas últimas {self.window})",
+                  'curriculum_change', old_depth=old, depth=self.current_depth, win_rate=rate)
+
+    def describe(self):
+        return {'curriculum': 'adaptive', 'curriculum_depth': self.current_depth, 'win_rate': self.win_rate(),
+                'window_games': len(self.results)}
+
+def make_curriculum(curriculum=None):
+    # None ou degraus (episódio, profundidade) -> FixedCurriculum; um objeto
+    # com depth/record é usado como está
+    if curriculum is None or isinstance(curriculum, (tuple, list)):
+        return FixedCurriculum(curriculum)
+    return curriculum
+
+_minimax_opponents = {} # Minimax por profundidade, vivo durante todo o processo (com a tabela de transposição)
+MINIMAX_WORKERS = 1 # Processos da busca paralela dos Minimax de minimax_opponent
+
+def minimax_opponent(depth, tablebase=None):
+    key = (depth, id(tablebase) if tablebase is not None else None)
+    if key not in _minimax_opponents:
+        _minimax_opponents[key] = MinimaxAgent(depth=depth, book=load_opening_book(), tablebase=tablebase,
+                                               workers=MINIMAX_WORKERS)
+    return _minimax_opponents[key]
+
+def _record_update(agent, state, action, reward, next_moves, transitions, learn=True):
+    # Atualiza a Q-table (se learn) e, se pedido, guarda a transição já codificada
+    s_key, a_code = encode_state_key(state), action_code(state, action)
+    s2_key = encode_state_key(action) # next_state é a própria ação
+    next_codes = action_codes(action, next_moves)
+    if learn:
+        agent.update_encoded(s_key, a_code, reward, s2_key, next_codes)
+    if transitions is not None:
+        transitions.append((s_key, a_code, reward, s2_key, next_codes))
+
+def play_minimax_episode(agent, minimax, transitions=None, learn=True):
+    # Um episódio do Q-Agent (pretas) contra o Minimax (brancas); atualiza a
+    # Q-table (learn=False só coleta as transições) e agent.stats
+    state = initial_state()
+    while True:
+        if state['turn'] == 'white':
+            moves = successors(state)
+            if not moves: # Sem movimentos válidos para o Minimax
+                winner = 'black' # Q-Agent vence por falta de movimentos do Minimax
+                break
+            state = minimax.choose_action(state, moves)
+            if state is None: # Se o minimax não encontrar um movimento (pode acontecer com profundidade 0 ou se successors estiver vazia)
+                winner = 'black' # Q-Agent vence
+                break
 
-def train_against_minimax(agent, num_episodes_to_train):
-    print(f"🚀 Treinando por {num_episodes_to_train} episódios contra Minimax...")
+        else:
+            moves = successors(state)
+            if not moves: # Sem movimentos válidos para o Q-Agent
+                winner = 'white' # Minimax vence
+                break
+            action = agent.choose_action(state, moves)
+            if not action: # Se o Q-Agent não escolher uma ação
+                winner = 'white' # Minimax vence
+                break
+
+            next_state = action
+            next_moves = successors(next_state) # Próximos movimentos a partir do next_state
+            winner = game_over(next_state)
+
+            # recompensa reforçada
+            if winner:
+              if winner == 'black':
+                reward = +1000.0
+                agent.stats['wins'] += 1
+              elif winner == 'white':
+                reward = -1000.0
+                agent.stats['losses'] += 1
+              else:
+                reward = -1200.0
+                agent.stats['draws'] += 1
+            else:
+              delta = advanced_heuristic(next_state) - advanced_heuristic(state)
+              reward = delta * 0.5 - 0.2
+              if agent.tablebase is not None:
+                reward += tablebase_reward(agent.tablebase, next_state, agent.gamma)
+
+            _record_update(agent, state, action, reward, next_moves, transitions, learn)
+            state = next_state
+            if winner: break
+    return winner
+
+def _check_replay(agent, replay):
+    if replay is not None and replay.symmetry != agent.symmetry:
+        raise ValueError("O ReplayBuffer precisa usar a mesma simetria do agente")
+
+def _learn_from_replay(agent, replay, transitions):
+    # Guarda as transições do episódio e faz os lotes de atualização que lhes cabem
+    replay.extend(transitions)
+    for _ in range(replay.replay_batches(len(transitions))):
+        agent.replay(replay)
+
+def train_against_minimax(agent, num_episodes_to_train, q_file=None, curriculum=None, replay=None):
+    # q_file: arquivo da Q-table (Q_TABLE_FILE por padrão); curriculum: degraus
+    # (episódio inicial, profundidade) ou um FixedCurriculum/AdaptiveCurriculum.
+    # Com replay (um ReplayBuffer), o episódio só coleta as transições e o
+    # aprendizado vem dos lotes sorteados do buffer
+    q_file = q_file or Q_TABLE_FILE
+    curriculum = make_curriculum(curriculum)
+    _check_replay(agent, replay)
+    log_event(f"🚀 Treinando por {num_episodes_to_train} episódios contra Minimax...", 'train_start',
+              mode='minimax', episodes=num_episodes_to_train)
     start_time = time.time() # Para medir o tempo de treinamento
 
     start_episode_idx = agent.stats.get('wins', 0) + agent.stats.get('losses', 0) + agent.stats.get('draws', 0)
@@ -311,147 +2393,732 @@ def train_against_minimax(agent, num_episodes_to_train):
     for i in range(num_episodes_to_train):
         ep = start_episode_idx + i # O índice real do episódio para o decaimento de epsilon
 
-        # Currículo de profundidade para o Minimax (mais gradual)
-        current_minimax_depth = 1 # Profundidade padrão
-        if ep < 3000: # Estende a profundidade 1
-            current_minimax_depth = 1
-        elif ep < 8000: # Estende a profundidade 2
-            current_minimax_depth = 2
-        else: # Profundidade 3 só nos últimos 20% do treinamento (se for 10k episódios)
-            current_minimax_depth = 3
-
-        minimax = MinimaxAgent(depth=current_minimax_depth) # Instancia Minimax com profundidade atualizada
-        state = initial_state()
+        current_minimax_depth = curriculum.depth(ep)
+        # Reaproveita a tabela de transposição entre episódios; com a tabela de
+        # finais do agente, o Minimax também joga os finais com exatidão
+        minimax = minimax_opponent(current_minimax_depth, agent.tablebase)
         agent.training_mode = True
         agent.epsilon = max(EPSILON_MIN, EPSILON_START * (EPSILON_DECAY ** ep)) # Decaimento de epsilon
 
-        while True:
-            if state['turn'] == 'white':
-                moves = successors(state)
-                if not moves: # Sem movimentos válidos para o Minimax
-                    winner = 'black' # Q-Agent vence por falta de movimentos do Minimax
-                    break
-                state = minimax.choose_action(state, moves)
-                if state is None: # Se o minimax não encontrar um movimento (pode acontecer com profundidade 0 ou se successors estiver vazia)
-                    winner = 'black' # Q-Agent vence
-                    break
-
-            else:
-                moves = successors(state)
-                if not moves: # Sem movimentos válidos para o Q-Agent
-                    winner = 'white' # Minimax vence
-                    break
-                action = agent.choose_action(state, moves)
-                if not action: # Se o Q-Agent não escolher uma ação
-                    winner = 'white' # Minimax vence
-                    break
-
-                next_state = action
-                next_moves = successors(next_state) # Próximos movimentos a partir do next_state
-                winner = game_over(next_state)
-
-                # recompensa reforçada
-                if winner:
-                  if winner == 'black':
-                    reward = +1000.0
-                    agent.stats['wins'] += 1
-                  elif winner == 'white':
-                    reward = -1000.0
-                    agent.stats['losses'] += 1
-                  else:
-                    reward = -1200.0
-                    agent.stats['draws'] += 1
-                else:
-                  delta = advanced_heuristic(next_state) - advanced_heuristic(state)
-                  reward = delta * 0.5 - 0.2
-
-                agent.update(state, action, reward, next_state, next_moves)
-                state = next_state
-                if winner: break
+        if replay is None:
+            winner = play_minimax_episode(agent, minimax)
+        else:
+            transitions = []
+            winner = play_minimax_episode(agent, minimax, transitions, learn=False)
+            _learn_from_replay(agent, replay, transitions)
+        curriculum.record(current_minimax_depth, winner)
 
         # Relatório periódico e salvamento assíncrono (se houver alteração)
         if (i + 1) % SAVE_INTERVAL == 0: # Agora baseado no 'i' do ciclo atual de treinamento
-            agent.save(PICKLE_FILE)
+            agent.checkpoint(q_file)
             elapsed_time = time.time() - start_time
-            print(f"[Ep {ep+1}/{start_episode_idx + num_episodes_to_train}] ε={agent.epsilon:.3f} | Wins={agent.stats['wins']} | Tempo decorrido: {elapsed_time:.2f}s")
+            log_event(f"[Ep {ep+1}/{start_episode_idx + num_episodes_to_train}] ε={agent.epsilon:.3f} | Wins={agent.stats['wins']} | Tempo decorrido: {elapsed_time:.2f}s",
+                      'progress', episode=ep + 1, total=start_episode_idx + num_episodes_to_train, epsilon=agent.epsilon,
+                      depth=current_minimax_depth, stats=dict(agent.stats), elapsed_s=round(elapsed_time, 3),
+                      **curriculum.describe())
+            if INSTRUMENTATION.enabled:
+                INSTRUMENTATION.log(agent, ep + 1)
             start_time = time.time() # Reseta o tempo para o próximo intervalo
 
     # Salvar ao final do treinamento
-    agent.save(PICKLE_FILE)
-    print("✅ Treino contra Minimax concluído!")
+    agent.save(q_file)
+    log_event("✅ Treino contra Minimax concluído!", 'train_done', mode='minimax', stats=dict(agent.stats))
 
-def train_agent(agent, num_episodes_to_train): # Adicionado 'num_episodes_to_train'
-    print(f"🚀 Treinando por {num_episodes_to_train} episódios (Self-Play)...")
+def play_self_play_episode(agent, transitions=None):
+    # Um episódio de self-play; atualiza a Q-table e agent.stats e devolve a recompensa total
+    state=initial_state()
+    total_r=0
+    while True:
+        moves=successors(state)
+        if not moves: break
+        act=agent.choose_action(state,moves)
+        if not act: break
+        next_moves=successors(act)
+        w=game_over(act)
+        if w:
+            r=1.0 if w=='black' else -1.0
+            agent.stats['wins' if w=='black' else 'losses']+=1
+        else:
+            prog=(advanced_heuristic(act)-advanced_heuristic(state))*0.01
+            r=prog-0.01
+        _record_update(agent, state, act, r, next_moves, transitions)
+        state=act
+        total_r+=r
+        if w: break
+    return total_r
+
+def train_agent(agent, num_episodes_to_train, q_file=None): # Adicionado 'num_episodes_to_train'
+    q_file = q_file or Q_TABLE_FILE
+    log_event(f"🚀 Treinando por {num_episodes_to_train} episódios (Self-Play)...", 'train_start',
+              mode='self', episodes=num_episodes_to_train)
     start_episode_idx = agent.stats.get('wins', 0) + agent.stats.get('losses', 0) + agent.stats.get('draws', 0)
     for i in range(num_episodes_to_train):
         ep = start_episode_idx + i
-        state=initial_state()
-        total_r=0
-        while True:
-            moves=successors(state)
-            if not moves: break
-            act=agent.choose_action(state,moves)
-            if not act: break
-            next_moves=successors(act)
-            w=game_over(act)
-            if w:
-                r=1.0 if w=='black' else -1.0
-                agent.stats['wins' if w=='black' else 'losses']+=1
-            else:
-                prog=(advanced_heuristic(act)-advanced_heuristic(state))*0.01
-                r=prog-0.01
-            agent.update(state,act,r,act,next_moves)
-            state=act
-            total_r+=r
-            if w: break
+        total_r = play_self_play_episode(agent)
         agent.decay_epsilon()
         agent.stats['total_rewards']+=total_r
         if (i+1)%100==0:
             tot=agent.stats['wins']+agent.stats['losses']+agent.stats['draws']
-            print(f"Epi {ep+1}/{start_episode_idx + num_episodes_to_train} | ε={agent.epsilon:.3f} | Winrate={agent.stats['wins']/tot:.1%}")
-    agent.save(PICKLE_FILE)
-    print("✅ Treino concluído!")
+            log_event(f"Epi {ep+1}/{start_episode_idx + num_episodes_to_train} | ε={agent.epsilon:.3f} | Winrate={agent.stats['wins']/tot:.1%}",
+                      'progress', episode=ep + 1, total=start_episode_idx + num_episodes_to_train, epsilon=agent.epsilon,
+                      stats=dict(agent.stats))
+            if INSTRUMENTATION.enabled:
+                INSTRUMENTATION.log(agent, ep + 1)
+    agent.save(q_file)
+    log_event("✅ Treino concluído!", 'train_done', mode='self', stats=dict(agent.stats))
+
+# Treinamento paralelo
+#
+# Cada processo joga um lote de episódios com uma cópia da Q-table (aprendendo
+# localmente durante o lote) e devolve as transições codificadas. O processo
+# principal aplica essas transições na Q-table do agente, na ordem dos
+# episódios, e manda uma cópia nova para os processos a cada rodada.
+
+PARALLEL_EPISODES_PER_TASK = 25 # Episódios por processo entre duas sincronizações da Q-table
+
+_training_worker = {} # Dados fixos de cada processo de treino (a tabela de finais)
+
+def _init_training_worker(tablebase):
+    # A tabela vai uma vez para cada processo, não a cada tarefa, e os Minimax
+    # do processo (minimax_opponent) são sempre os mesmos
+    _training_worker['tablebase'] = tablebase
+
+def _parallel_training_worker(task):
+    mode, q_table, episodes, params = task
+    alpha, gamma, policy, epsilon0, seed, symmetry = params
+    agent = QLearningAgent(alpha, gamma, epsilon0, policy, saver=False, symmetry=symmetry,
+                           tablebase=_training_worker.get('tablebase'))
+    agent.q_table = q_table
+    episode_results = []
+    for ep, i, depth in episodes:
+        random.seed(seed + ep)
+        transitions = []
+        before = dict(agent.stats)
+        agent.training_mode = True
+        if mode == 'minimax':
+            agent.epsilon = max(EPSILON_MIN, EPSILON_START * (EPSILON_DECAY ** ep))
+            winner = play_minimax_episode(agent, minimax_opponent(depth, agent.tablebase), transitions)
+            total_r = 0
+        else:
+            # Mesmo epsilon que o self-play serial teria após i decaimentos
+            agent.epsilon = max(EPSILON_MIN, epsilon0 * (EPSILON_DECAY ** i))
+            total_r = play_self_play_episode(agent, transitions)
+            winner = None
+        stats_delta = {k: agent.stats[k] - before[k] for k in ('wins', 'losses', 'draws')}
+        stats_delta['total_rewards'] = total_r
+        episode_results.append((ep, depth, winner, transitions, stats_delta))
+    return episode_results
+
+def train_parallel(agent, num_episodes_to_train, mode='minimax', workers=None, seed=0,
+                   episodes_per_task=PARALLEL_EPISODES_PER_TASK, q_file=None, curriculum=None, replay=None):
+    # mode='minimax' equivale a train_against_minimax; mode='self' a train_agent.
+    # As profundidades do currículo são sorteadas no processo principal no
+    # início de cada rodada, então um currículo adaptativo só muda entre rodadas.
+    # Com replay, as transições dos processos vão para o buffer em vez de
+    # serem aplicadas uma a uma
+    workers = workers or os.cpu_count() or 1
+    q_file = q_file or Q_TABLE_FILE
+    curriculum = make_curriculum(curriculum)
+    _check_replay(agent, replay)
+    label = 'contra Minimax' if mode == 'minimax' else '(Self-Play)'
+    log_event(f"🚀 Treinando por {num_episodes_to_train} episódios {label} com {workers} processos...", 'train_start',
+              mode=mode, episodes=num_episodes_to_train, workers=workers)
+    start_time = time.time()
+    start_episode_idx = agent.stats.get('wins', 0) + agent.stats.get('losses', 0) + agent.stats.get('draws', 0)
+    epsilon0 = agent.epsilon
+    params = (agent.alpha, agent.gamma, agent.policy, epsilon0, seed, agent.symmetry)
+    round_size = workers * episodes_per_task
+    next_report = SAVE_INTERVAL
+
+    with multiprocessing.Pool(workers, initializer=_init_training_worker, initargs=(agent.tablebase,)) as pool:
+        done = 0
+        while done < num_episodes_to_train:
+            count = min(round_size, num_episodes_to_train - done)
+            episodes = [(start_episode_idx + done + j, done + j,
+                         curriculum.depth(start_episode_idx + done + j) if mode == 'minimax' else None)
+                        for j in range(count)]
+            tasks = [(mode, agent.q_table, episodes[w::workers], params) for w in range(workers) if episodes[w::workers]]
+            results = [r for batch in pool.map(_parallel_training_worker, tasks) for r in batch]
+            results.sort(key=lambda r: r[0])
+            for ep, depth, winner, transitions, stats_delta in results:
+                if replay is None:
+                    for transition in transitions:
+                        agent.update_encoded(*transition)
+                else:
+                    _learn_from_replay(agent, replay, transitions)
+                for k, v in stats_delta.items():
+                    agent.stats[k] += v
+                if mode == 'minimax':
+                    curriculum.record(depth, winner)
+            done += count
+
+            if mode == 'minimax':
+                ep = start_episode_idx + done - 1
+                agent.epsilon = max(EPSILON_MIN, EPSILON_START * (EPSILON_DECAY ** ep))
+            else:
+                agent.epsilon = max(EPSILON_MIN, epsilon0 * (EPSILON_DECAY ** done))
+
+            if done >= next_report or done == num_episodes_to_train:
+                next_report += SAVE_INTERVAL
+                agent.checkpoint(q_file)
+                elapsed_time = time.time() - start_time
+                log_event(f"[Ep {start_episode_idx + done}/{start_episode_idx + num_episodes_to_train}] ε={agent.epsilon:.3f} | Wins={agent.stats['wins']} | Tempo decorrido: {elapsed_time:.2f}s",
+                          'progress', episode=start_episode_idx + done, total=start_episode_idx + num_episodes_to_train,
+                          epsilon=agent.epsilon, stats=dict(agent.stats), elapsed_s=round(elapsed_time, 3),
+                          **(curriculum.describe() if mode == 'minimax' else {}))
+                if INSTRUMENTATION.enabled:
+                    INSTRUMENTATION.log(agent, start_episode_idx + done)
+                start_time = time.time()
+
+    agent.training_mode = True
+    log_event("✅ Treino paralelo concluído!", 'train_done', mode=mode, stats=dict(agent.stats))
+
+
+# Simulador em lote
+#
+# Muitas partidas avançando juntas, com o estado em arrays NumPy: squares[g, lado, peça]
+# é a casa (r*8+c) de cada peça, como no Position. Uma ação é o índice
+# peça*21 + direção*7 + (distância - 1), na mesma ordem de legal_moves() e de
+# successors(). Um lado sem movimentos encerra a partida empatada, como em evaluate().
+
+BATCH_ACTIONS = 8 * 3 * 7 # peças x direções x distâncias
+
+def _build_ray_table():
+    # RAY_TABLE[lado, casa, direção, passo] = casa de destino, ou 64 fora do tabuleiro
+    table = np.full((2, 64, 3, 7), 64, dtype=np.int64)
+    for side in (WHITE, BLACK):
+        for sq in range(64):
+            for d, ray in enumerate(RAYS[side][sq]):
+                table[side, sq, d, :len(ray)] = ray
+    return table
+
+RAY_TABLE = _build_ray_table()
+SQUARE_COLOR_ARRAY = np.array(SQUARE_COLOR + [NO_COLOR], dtype=np.int64) # 64 = fora do tabuleiro
+BATCH_DRAW, BATCH_RUNNING = 2, -1 # result: WHITE, BLACK, BATCH_DRAW ou BATCH_RUNNING
+BATCH_RESULTS = {None: BATCH_RUNNING, 'white': WHITE, 'black': BLACK, 'draw': BATCH_DRAW} # Position.winner() -> result
+_BYTE_REVERSE_ARRAY = np.array(BYTE_REVERSE, dtype=np.uint8)
+_COLOR_MIRROR_ARRAY = np.array((COLOR_MIRROR or list(range(len(COLOR_TO_INT)))) + [NO_COLOR], dtype=np.int64)
+
+def mirror_bitboards(bbs):
+    # Versão vetorizada de mirror_bitboard
+    bbs = np.ascontiguousarray(bbs, dtype=np.uint64)
+    return _BYTE_REVERSE_ARRAY[bbs.view(np.uint8)].view(np.uint64)
+
+class BatchKamisado:
+    def __init__(self, n, draw_reward=0.0):
+        self.n = n
+        self.draw_reward = draw_reward
+        self.reset()
+
+    def reset(self, first_turn=WHITE):
+        # first_turn pode ser um array com o lado que começa em cada partida
+        n = self.n
+        self.squares = np.empty((n, 2, 8), dtype=np.int64)
+        self.squares[:, WHITE] = 56 + np.arange(8) # linha 7
+        self.squares[:, BLACK] = np.arange(8) # linha 0
+        self.turn = np.broadcast_to(np.asarray(first_turn, dtype=np.int64), (n,)).copy()
+        self.next_color = np.full(n, NO_COLOR, dtype=np.int64)
+        self.no_progress = np.zeros(n, dtype=np.int64)
+        self.plies = np.zeros(n, dtype=np.int64)
+        self.result = np.full(n, BATCH_RUNNING, dtype=np.int64)
+        self._update_moves()
+
+    def load(self, positions):
+        # Recomeça o lote com uma partida por Position dada (o lote passa a ter len(positions) partidas)
+        self.n = n = len(positions)
+        self.squares = np.array([pos.squares for pos in positions], dtype=np.int64).reshape(n, 2, 8)
+        self.turn = np.array([pos.turn for pos in positions], dtype=np.int64)
+        self.next_color = np.array([pos.next_color for pos in positions], dtype=np.int64)
+        self.no_progress = np.array([pos.no_progress for pos in positions], dtype=np.int64)
+        self.plies = np.zeros(n, dtype=np.int64)
+        self.result = np.array([BATCH_RESULTS[pos.winner()] for pos in positions], dtype=np.int64)
+        self._update_moves()
+
+    @property
+    def done(self):
+        return self.result != BATCH_RUNNING
+
+    def _update_moves(self):
+        # Destinos e máscara de movimentos legais (n, 8, 3, 7) do lado a jogar
+        games = np.arange(self.n)
+        own = self.squares[games, self.turn] # (n, 8)
+        self.targets = RAY_TABLE[self.turn[:, None], own] # (n, 8, 3, 7)
+        occupied = np.zeros((self.n, 65), dtype=bool)
+        occupied[games[:, None], self.squares.reshape(self.n, 16)] = True
+        occupied[:, 64] = True
+        free = ~occupied[games[:, None, None, None], self.targets]
+        mask = np.logical_and.accumulate(free, axis=3) # para no primeiro bloqueio do raio
+        movable = (self.next_color[:, None] == NO_COLOR) | (SQUARE_COLOR_ARRAY[own] == self.next_color[:, None])
+        mask &= movable[:, :, None, None]
+        mask &= (self.result == BATCH_RUNNING)[:, None, None, None]
+        self.mask = mask.reshape(self.n, BATCH_ACTIONS)
+        # Sem movimentos: empate
+        self.result[(self.result == BATCH_RUNNING) & ~self.mask.any(axis=1)] = BATCH_DRAW
+
+    def legal_mask(self):
+        return self.mask
+
+    def moves(self, games, actions):
+        # (origem, destino) de cada par (partida, ação)
+        piece, rest = np.divmod(actions, 21)
+        return self.squares[games, self.turn[games], piece], self.targets.reshape(self.n, 8, 21)[games, piece, rest]
+
+    def step(self, actions):
+        # Aplica uma ação por partida (ignorada nas encerradas) e devolve a
+        # recompensa de cada partida do ponto de vista das pretas, o lado do
+        # Q-Agent nos treinos: +1 vitória, -1 derrota, draw_reward no empate
+        # e 0 enquanto ela continua
+        active = np.flatnonzero(~self.done)
+        actions = np.asarray(actions, dtype=np.int64)[active]
+        if not self.mask[active, actions].all():
+            raise ValueError("Ação ilegal em alguma partida do lote")
+        frm, to = self.moves(active, actions)
+        piece = actions // 21
+        side = self.turn[active]
+        self.squares[active, side, piece] = to
+        same_color = SQUARE_COLOR_ARRAY[to] == SQUARE_COLOR_ARRAY[frm]
+        self.no_progress[active] = np.where(same_color, self.no_progress[active] + 1, 0)
+        self.next_color[active] = SQUARE_COLOR_ARRAY[to]
+        self.turn[active] = side ^ 1
+        self.plies[active] += 1
+
+        # Mesma ordem de Position.winner(): empate por falta de progresso antes das chegadas
+        result = self.result[active]
+        result[self.no_progress[active] >= DRAW_THRESHOLD] = BATCH_DRAW
+        running = result == BATCH_RUNNING
+        result[running & (self.squares[active, WHITE] < 8).any(axis=1)] = WHITE
+        running = result == BATCH_RUNNING
+        result[running & (self.squares[active, BLACK] >= 56).any(axis=1)] = BLACK
+        self.result[active] = result
+        self._update_moves()
+
+        rewards = np.zeros(self.n)
+        ended = np.zeros(self.n, dtype=bool)
+        ended[active] = self.done[active]
+        rewards[ended & (self.result == BLACK)] = 1.0
+        rewards[ended & (self.result == WHITE)] = -1.0
+        rewards[ended & (self.result == BATCH_DRAW)] = self.draw_reward
+        return rewards
+
+    def bitboards(self):
+        # (brancas, pretas) de cada partida como arrays uint64
+        bits = np.left_shift(np.uint64(1), self.squares.astype(np.uint64))
+        return np.bitwise_or.reduce(bits, axis=2).T
+
+    def action_keys(self, games, actions, symmetry=False):
+        # Chaves da Q-table (arrays de brancas, pretas e x) de cada par (partida, ação)
+        w, b = self.bitboards()
+        w, b = w[games], b[games]
+        frm, to = self.moves(games, actions)
+        meta = self.turn[games] << 4 | (self.next_color[games] + 1)
+        x = (meta << 12 | frm * 64 + to).astype(np.uint32)
+        if symmetry:
+            mw, mb = mirror_bitboards(w), mirror_bitboards(b)
+            mmeta = self.turn[games] << 4 | (_COLOR_MIRROR_ARRAY[self.next_color[games]] + 1)
+            mx = (mmeta << 12 | (frm * 64 + to) ^ MIRROR_CODE).astype(np.uint32)
+            # Menor das duas chaves, comparando as partes em ordem
+            use = (mw < w) | ((mw == w) & ((mb < b) | ((mb == b) & (mx < x))))
+            w, b, x = np.where(use, mw, w), np.where(use, mb, b), np.where(use, mx, x)
+        return w, b, x
+
+    def position(self, g):
+        # Position da partida g (para conferir com o motor de uma partida)
+        return Position([self.squares[g, WHITE].tolist(), self.squares[g, BLACK].tolist()],
+                        int(self.turn[g]), int(self.next_color[g]), int(self.no_progress[g]))
+
+class BatchRandomAgent:
+    # Escolhe uniformemente entre os movimentos legais de cada partida
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    def choose_actions(self, env):
+        scores = self.rng.random((env.n, BATCH_ACTIONS))
+        scores[~env.mask] = -1.0
+        return scores.argmax(axis=1)
+
+class BatchQAgent:
+    # Q-greedy sobre a Q-table de um QLearningAgent (com epsilon opcional);
+    # os valores de todas as ações legais do lote vêm de uma única consulta
+    def __init__(self, agent, epsilon=0.0, seed=None):
+        self.agent = agent
+        self.epsilon = epsilon
+        self.random = BatchRandomAgent(seed)
+
+    def q_values(self, env):
+        # (n, BATCH_ACTIONS) com -inf nas ações ilegais
+        games, actions = np.nonzero(env.mask)
+        qs = np.full((env.n, BATCH_ACTIONS), -np.inf)
+        qs[games, actions] = self.agent.q_table.get_many(*env.action_keys(games, actions, self.agent.symmetry))
+        return qs
+
+    def choose_actions(self, env):
+        # argmax fica com a primeira ação de maior valor, como choose_action()
+        actions = self.q_values(env).argmax(axis=1)
+        if self.epsilon > 0:
+            explore = self.random.rng.random(env.n) < self.epsilon
+            actions = np.where(explore, self.random.choose_actions(env), actions)
+        return actions
+
+def play_batch(env, white_agent, black_agent, first_turn=WHITE):
+    # Joga todas as partidas do lote até o fim; devolve a soma das recompensas
+    # (pretas) de cada partida
+    env.reset(first_turn)
+    total = np.zeros(env.n)
+    while not env.done.all():
+        white_actions = white_agent.choose_actions(env)
+        black_actions = black_agent.choose_actions(env)
+        total += env.step(np.where(env.turn == WHITE, white_actions, black_actions))
+    return total
+
+# Monte Carlo Tree Search
+#
+# Seleção por UCT (com viés progressivo das prioridades da Q-table, se houver
+# um QLearningAgent), expansão de um filho por simulação e partidas aleatórias
+# até o fim jogadas em lote no BatchKamisado: cada lote escolhe batch_size
+# folhas com perda virtual, para que as seleções do mesmo lote se espalhem. O
+# valor de um nó é a soma dos resultados (+1 vitória, -1 derrota, 0 empate)
+# do ponto de vista de quem fez o movimento que leva a ele; um lado sem
+# movimentos empata, como em evaluate(). A árvore é guardada entre jogadas: a
+# posição da jogada seguinte é procurada entre os netos da raiz anterior.
+
+MCTS_PLAYOUTS = 2000
+MCTS_BATCH = 64
+MCTS_EXPLORATION = 1.4
+MCTS_POLL_SECONDS = 0.05 # Intervalo em que a busca paralela confere o cancelamento
+
+class MCTSNode:
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'value', 'prior', 'terminal')
+
+    def __init__(self, move=None, parent=None, prior=0.0):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = None # Movimentos ainda sem filho (None: nó ainda não visitado)
+        self.visits = 0
+        self.value = 0.0
+        self.prior = prior
+        self.terminal = None # Resultado (BATCH_RESULTS) se a posição encerra a partida
+
+_mcts_worker = {} # Agente MCTS de cada processo (com a sua própria árvore)
+
+def _init_mcts_worker(config, seed, cancel):
+    # cancel: multiprocessing.Event com que o processo principal encerra as simulações
+    _mcts_worker['agent'] = MCTSAgent(**config, workers=1, seed=seed)
+    _mcts_worker['agent'].cancel = cancel
+
+def _mcts_worker_search(task):
+    # Busca na árvore do processo; devolve as visitas e os valores dos filhos da raiz.
+    # Com reset_seed, a árvore é descartada e as simulações usam essa semente
+    state, playouts, time_ms, reset_seed = task
+    agent = _mcts_worker['agent']
+    if reset_seed is not None:
+        agent.reset(reset_seed)
+    agent.playouts, agent.time_ms = playouts, time_ms
+    root, count = agent._search(Position.from_dict(state))
+    return [(child.move, child.visits, child.value) for child in root.children], count
+
+class MCTSAgent:
+    # playouts: simulações por jogada; com time_ms, simula até o tempo acabar.
+    # q_agent (opcional): QLearningAgent cujos Q(s, a) dão as prioridades dos
+    # filhos (softmax com prior_temperature), pesadas por prior_weight.
+    # workers > 1 paraleliza pela raiz: cada processo mantém a sua árvore e as
+    # visitas dos filhos da raiz são somadas (dentro de outro pool, como nos
+    # processos de evaluate, a busca é serial). O processo k é semeado com
+    # seed * workers + k, então a mesma seed repete as buscas. last_search guarda simulações,
+    # tempo, simulações/s e quantas visitas da árvore anterior foram reusadas.
+    def __init__(self, playouts=MCTS_PLAYOUTS, time_ms=None, batch_size=MCTS_BATCH, exploration=MCTS_EXPLORATION,
+                 q_agent=None, prior_weight=1.0, prior_temperature=1.0, workers=1, seed=None):
+        self.playouts, self.time_ms = playouts, time_ms
+        self.batch_size, self.exploration = batch_size, exploration
+        self.q_agent, self.prior_weight, self.prior_temperature = q_agent, prior_weight, prior_temperature
+        self.workers = workers
+        self.seed = seed
+        self.cancel = None # threading.Event que encerra as simulações em andamento
+        self.rollout_agent = BatchRandomAgent(seed)
+        self.training_mode = False # Mesma interface do QLearningAgent em play_vs_agent/evaluate
+        self.epsilon = 0.0
+        self.root = None
+        self.root_pos = None
+        self.pools = None # Um pool de um processo por worker (ver _parallel_search)
+        self._pool_cancel = None
+        self._reset_seed = None # Semente do próximo reset dos processos do pool
+        self.last_search = {'playouts': 0, 'time_ms': 0.0, 'playouts_per_sec': 0.0, 'reused_visits': 0}
+
+    def __getstate__(self):
+        # Os pools de processos ficam só no processo original
+        state = self.__dict__.copy()
+        state['pools'] = state['_pool_cancel'] = None
+        return state
+
+    def reset(self, seed=None):
+        # Descarta a árvore; com seed, as simulações recomeçam dessa semente
+        # (nos processos de workers > 1, a partir da próxima busca)
+        self.root = self.root_pos = None
+        if seed is not None:
+            self.rollout_agent = BatchRandomAgent(seed)
+            self._reset_seed = seed
+
+    def close(self):
+        if self.pools is not None:
+            for pool in self.pools:
+                pool.close()
+                pool.join()
+            self.pools = None
+
+    def _config(self):
+        return {'batch_size': self.batch_size, 'exploration': self.exploration, 'q_agent': self.q_agent,
+                'prior_weight': self.prior_weight, 'prior_temperature': self.prior_temperature}
+
+    def _reuse_root(self, pos):
+        # Nó da árvore anterior com a mesma posição (a raiz, um filho ou um neto)
+        if self.root is None:
+            return None
+        target = (position_signature(pos), pos.no_progress)
+        frontier = [(self.root, self.root_pos)]
+        for _ in range(3):
+            nxt = []
+            for node, node_pos in frontier:
+                if (position_signature(node_pos), node_pos.no_progress) == target:
+                    return node
+                for child in node.children:
+                    child_pos = node_pos.copy()
+                    child_pos.make_move(child.move)
+                    nxt.append((child, child_pos))
+            frontier = nxt
+        return None
+
+    def _expand(self, node, pos):
+        # Primeira visita: resultado terminal ou movimentos a expandir, do
+        # menos para o mais provável (untried.pop() pega o mais provável)
+        winner = pos.winner()
+        moves = pos.legal_moves() if winner is None else []
+        if winner is not None or not moves:
+            node.terminal = BATCH_RESULTS[winner or 'draw']
+            node.untried = []
+            return
+        priors = np.full(len(moves), 1.0 / len(moves))
+        if self.q_agent is not None:
+            qs = self.q_agent.action_values(state_key(pos), tuple(move_code(m) for m in moves))
+            exps = np.exp((qs - qs.max()) / self.prior_temperature)
+            priors = exps / exps.sum()
+        # Empates ficam na ordem de legal_moves()
+        order = sorted(range(len(moves)), key=lambda i: (priors[i], -i))
+        node.untried = [(moves[i], float(priors[i])) for i in order]
+
+    def _select(self, root, root_pos):
+        # Desce pela árvore aplicando a perda virtual; devolve (caminho, posição da folha)
+        node, pos = root, root_pos.copy()
+        path = [node]
+        node.visits += 1
+        while True:
+            if node.untried is None:
+                self._expand(node, pos)
+            if node.terminal is not None:
+                return path, pos
+            if node.untried:
+                move, prior = node.untried.pop()
+                child = MCTSNode(move, node, prior)
+                node.children.append(child)
+            else:
+                log_n = np.log(node.visits)
+                c, bias = self.exploration, self.prior_weight
+                child = max(node.children, key=lambda ch: ch.value / ch.visits + c * (log_n / ch.visits) ** 0.5
+                            + bias * ch.prior / (1 + ch.visits))
+            pos.make_move(child.move)
+            child.visits += 1
+            child.value -= 1.0 # Perda virtual
+            path.append(child)
+            node = child
+            if child.visits == 1: # Folha nova: a simulação parte daqui
+                return path, pos
+
+    def _backpropagate(self, path, pos, result):
+        # result: WHITE, BLACK ou BATCH_DRAW; desfaz a perda virtual no caminho
+        turn = pos.turn
+        for node in reversed(path[1:]):
+            turn ^= 1 # Quem fez o movimento que leva a node
+            node.value += 1.0 + (0.0 if result == BATCH_DRAW else (1.0 if result == turn else -1.0))
+
+    def _run_batch(self, root, root_pos, size):
+        leaves = [self._select(root, root_pos) for _ in range(size)]
+        results = [path[-1].terminal for path, _ in leaves]
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            env = BatchKamisado.__new__(BatchKamisado)
+            env.draw_reward = 0.0
+            env.load([leaves[i][1] for i in pending])
+            while not env.done.all():
+                env.step(self.rollout_agent.choose_actions(env))
+            for i, r in zip(pending, env.result.tolist()):
+                results[i] = r
+        for (path, pos), result in zip(leaves, results):
+            self._backpropagate(path, pos, result)
+
+    def _search(self, pos):
+        # Simulações a partir de pos (reusando a árvore anterior); devolve (raiz, simulações feitas)
+        start = time.perf_counter()
+        root = self._reuse_root(pos)
+        reused = root.visits if root is not None else 0
+        if root is None:
+            root = MCTSNode()
+        root.parent = None
+        self.root, self.root_pos = root, pos.copy()
+        deadline = None if self.time_ms is None else start + self.time_ms / 1000
+        count = 0
+        while deadline is None and count < self.playouts or deadline is not None and time.perf_counter() < deadline:
+            if self.cancel is not None and self.cancel.is_set():
+                break
+            size = self.batch_size if deadline is not None else min(self.batch_size, self.playouts - count)
+            self._run_batch(root, pos, size)
+            count += size
+        elapsed = time.perf_counter() - start
+        self.last_search = {'playouts': count, 'time_ms': elapsed * 1000, 'reused_visits': reused,
+                            'playouts_per_sec': count / elapsed if elapsed else 0.0}
+        return root, count
 
+    def choose_action(self, state, possible_moves):
+        if not possible_moves:
+            return None
+        pos = Position.from_dict(state)
+        if self.workers > 1 and not multiprocessing.current_process().daemon:
+            return pos.child_dict(self._parallel_search(state))
+        root, _ = self._search(pos)
+        if not root.children:
+            return possible_moves[0]
+        return pos.child_dict(max(root.children, key=lambda ch: ch.visits).move)
+
+    def _parallel_search(self, state):
+        # Paralelização pela raiz: cada processo faz a sua parte das simulações.
+        # Cada worker tem o seu pool de um processo, para que a busca k caia
+        # sempre no mesmo processo (e na mesma árvore)
+        start = time.perf_counter()
+        if self.pools is None:
+            self._pool_cancel = multiprocessing.Event()
+            self.pools = [multiprocessing.Pool(1, initializer=_init_mcts_worker,
+                                               initargs=(self._config(), (self.seed or 0) * self.workers + k,
+                                                         self._pool_cancel))
+                          for k in range(self.workers)]
+        playouts = -(-self.playouts // self.workers)
+        reset_seed, self._reset_seed = self._reset_seed, None
+        pending = [pool.apply_async(_mcts_worker_search, ((state, playouts, self.time_ms,
+                                                           None if reset_seed is None else reset_seed * self.workers + k),))
+                   for k, pool in enumerate(self.pools)]
+        # Enquanto espera, confere o cancel a cada MCTS_POLL_SECONDS; cancelada,
+        # os processos encerram as simulações e as buscas são descartadas
+        for result in pending:
+            while not result.ready():
+                if self.cancel is not None and self.cancel.is_set():
+                    self._pool_cancel.set()
+                    for other in pending:
+                        other.wait()
+                    self._pool_cancel.clear()
+                    raise SearchAborted()
+                result.wait(MCTS_POLL_SECONDS)
+        results = [result.get() for result in pending]
+        visits, count = {}, 0
+        for children, n in results:
+            count += n
+            for move, child_visits, _ in children:
+                visits[move] = visits.get(move, 0) + child_visits
+        elapsed = time.perf_counter() - start
+        self.last_search = {'playouts': count, 'time_ms': elapsed * 1000, 'reused_visits': 0,
+                            'playouts_per_sec': count / elapsed if elapsed else 0.0}
+        return max(visits, key=visits.get)
+
+def play_evaluation_game(agent, minimax, i, seed=None):
+    # Uma partida de avaliação; nos jogos pares o Q-Agent (pretas) começa.
+    # Com seed, a partida usa random.seed(seed + i), um Minimax zerado e, para o
+    # MCTSAgent, uma árvore nova com as simulações semeadas por seed + i, de modo
+    # que o resultado não depende de quais partidas vieram antes no mesmo processo
+    if seed is not None:
+        random.seed(seed + i)
+        minimax.reset()
+        if isinstance(agent, MCTSAgent):
+            agent.reset(seed + i)
+    state=initial_state()
+    if i%2==0:
+        state['turn']='black'
+        current_first_player = 'Q-Agent'
+    else:
+        state['turn']='white'
+        current_first_player = 'Minimax'
 
-def evaluate(agent,n=50):
+    plies = 0
+    while True:
+        w=game_over(state)
+        if w:
+            if w == 'black':
+                result = 'q_wins'
+            elif w == 'white':
+                result = 'minimax_wins'
+            else: # draw
+                result = 'draws'
+            break
+        moves=successors(state)
+        if not moves:
+            result = 'draws'; break
+        if state['turn']=='black':
+            a=agent.choose_action(state,moves)
+        else:
+            a=minimax.choose_action(state,moves)
+        if not a:
+            result = 'draws'; break
+        state=a
+        plies += 1
+    return {'game': i, 'first_player': current_first_player, 'result': result, 'plies': plies,
+            'seed': None if seed is None else seed + i}
+
+_eval_worker = {} # Agente e Minimax de cada processo de avaliação
+
+def _init_evaluation_worker(agent, minimax_eval_depth, opponent=None):
+    # Com fork, o agente (e a Q-table) é herdado do processo principal sem ser
+    # serializado; cada processo o usa apenas para leitura
+    _eval_worker['agent'] = agent
+    _eval_worker['minimax'] = opponent or MinimaxAgent(minimax_eval_depth, book=load_opening_book())
+
+def _evaluation_worker(task):
+    i, seed = task
+    return play_evaluation_game(_eval_worker['agent'], _eval_worker['minimax'], i, seed)
+
+def evaluate(agent,n=50,workers=1,seed=None,details=False,minimax_depth=3,opponent=None):
+    # workers > 1 distribui as partidas entre processos; a mesma seed dá o mesmo
+    # resultado com qualquer número de processos. details=True inclui em
+    # res['games'] o resultado de cada partida. agent (pretas) pode ser qualquer
+    # agente com choose_action e training_mode (QLearningAgent, MCTSAgent);
+    # opponent (brancas) substitui o Minimax de minimax_depth e precisa de reset()
     # Minimax depth para avaliação pode ser fixo ou ajustado
-    minimax_eval_depth = 3
-    minimax=MinimaxAgent(minimax_eval_depth)
+    minimax_eval_depth = minimax_depth
     res={'q_wins':0,'minimax_wins':0,'draws':0}
-    print(f"🧪 Avaliando {n} partidas...")
+    games=[]
+    log_event(f"🧪 Avaliando {n} partidas...", 'evaluate_start', games=n, depth=minimax_eval_depth, workers=workers)
     agent.training_mode = False
-    for i in range(n):
-        state=initial_state()
-        if i%2==0:
-            state['turn']='black'
-            current_first_player = 'Q-Agent'
-        else:
-            state['turn']='white'
-            current_first_player = 'Minimax'
+    if workers > 1 and seed is None:
+        seed = 0 # A distribuição entre processos só é reprodutível com seeds por partida
 
-        while True:
-            w=game_over(state)
-            if w:
-                if w == 'black':
-                    res['q_wins']+=1
-                elif w == 'white':
-                    res['minimax_wins']+=1
-                else: # draw
-                    res['draws']+=1
-                break
-            moves=successors(state)
-            if not moves:
-                res['draws']+=1; break
-            if state['turn']=='black':
-                a=agent.choose_action(state,moves)
-            else:
-                a=minimax.choose_action(state,moves)
-            if not a:
-                res['draws']+=1; break
-            state=a
-        if (i+1)%10==0:
-            print(f"{i+1}/{n} | Q:{res['q_wins']} Min:{res['minimax_wins']} Emp:{res['draws']}")
-    print(f"Resultados: Q {res['q_wins']}/{n}, Min {res['minimax_wins']}/{n}, Emp {res['draws']}/{n}")
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_evaluation_worker,
+                                    initargs=(agent, minimax_eval_depth, opponent))
+        game_iter = pool.imap(_evaluation_worker, [(i, seed) for i in range(n)], chunksize=max(1, n // (workers * 4)))
+    else:
+        pool = None
+        minimax=opponent or MinimaxAgent(minimax_eval_depth, book=load_opening_book())
+        game_iter = (play_evaluation_game(agent, minimax, i, seed) for i in range(n))
+
+    try:
+        for i, game in enumerate(game_iter):
+            res[game['result']]+=1
+            games.append(game)
+            if (i+1)%10==0:
+                log_event(f"{i+1}/{n} | Q:{res['q_wins']} Min:{res['minimax_wins']} Emp:{res['draws']}",
+                          'evaluate_progress', played=i + 1, games=n, **res)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    log_event(f"Resultados: Q {res['q_wins']}/{n}, Min {res['minimax_wins']}/{n}, Emp {res['draws']}/{n}",
+              'evaluate_done', games=n, **res)
+    if details:
+        res['games'] = games
     return res
 
 
@@ -516,8 +3183,56 @@ def human_move(state):
         except ValueError:
             print("❌ Entrada inválida. Digite um número ou 'desistir'.")
 
+# Ponderação: enquanto o humano escolhe a jogada, uma thread calcula a resposta
+# do agente para cada jogada possível dele, das melhores para as brancas
+# (menor heurística) para as piores. Quando o humano joga, a thread é
+# cancelada; se a resposta para a jogada feita já estiver pronta, a IA responde
+# na hora. A busca em andamento é interrompida pelo Event cancel do agente
+# (MinimaxAgent, MCTSAgent); um QLearningAgent só consulta a Q-table, então
+# cada resposta sai logo de qualquer forma.
+
+class Ponderer:
+    def __init__(self, agent, state):
+        self.agent = agent
+        self.replies = {} # movimento do humano -> estado após a resposta do agente
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(state,), daemon=True)
+        self.thread.start()
+
+    def _run(self, state):
+        children = sorted(successors(state), key=advanced_heuristic)
+        can_cancel = hasattr(self.agent, 'cancel')
+        if can_cancel:
+            self.agent.cancel = self.cancelled
+        try:
+            for child in children:
+                if self.cancelled.is_set():
+                    break
+                moves = successors(child)
+                if game_over(child) or not moves:
+                    continue
+                try:
+                    reply = self.agent.choose_action(child, moves)
+                except SearchAborted:
+                    break
+                if self.cancelled.is_set(): # Resposta de uma busca interrompida
+                    break
+                self.replies[child['move']] = reply
+        finally:
+            if can_cancel:
+                self.agent.cancel = None
+
+    def stop(self):
+        # Cancela e espera a thread; depois disso o agente está livre
+        self.cancelled.set()
+        self.thread.join()
+
+    def reply(self, child):
+        return self.replies.get(child.get('move'))
+
 # Modo de jogo humano vs IA com opção de desistência
-def play_vs_agent(agent):
+def play_vs_agent(agent, ponder=True):
+    # ponder=True: o agente pondera enquanto o humano pensa (Ponderer)
     state = initial_state()
     print("\n=== 🎮 MODO DE JOGO: HUMANO vs IA ===")
     print("Você joga com as peças BRANCAS (B1-B8)")
@@ -529,6 +3244,7 @@ def play_vs_agent(agent):
     original_epsilon = agent.epsilon
     agent.training_mode = False
     agent.epsilon = 0.0 # Joga puramente de forma gananciosa
+    pondered = None # Resposta pronta para a jogada do humano
 
     try:
         while True:
@@ -541,7 +3257,13 @@ def play_vs_agent(agent):
 
             # Vez do humano
             if state['turn'] == 'white':
-                result = human_move(state)
+                ponderer = Ponderer(agent, state) if ponder else None
+                try:
+                    result = human_move(state)
+                finally:
+                    if ponderer is not None:
+                        ponderer.stop()
+                pondered = ponderer.reply(result) if ponderer is not None and isinstance(result, dict) else None
 
                 # Verificar desistência
                 if result == 'quit':
@@ -557,14 +3279,18 @@ def play_vs_agent(agent):
 
             # Vez da IA
             else:
-                print("\n🤖 IA está pensando...")
                 moves = successors(state)
                 if not moves:
                     print_game_state(state)
                     print("🎉 Você vence! IA sem movimentos válidos.")
                     break
 
-                action = agent.choose_action(state, moves)
+                if pondered is not None:
+                    action, pondered = pondered, None
+                    print("\n🤖 IA respondeu na hora (jogada já calculada)")
+                else:
+                    print("\n🤖 IA está pensando...")
+                    action = agent.choose_action(state, moves)
                 if not action:
                     print("❌ Erro: IA não conseguiu escolher movimento. Isso não deveria acontecer com movimentos válidos.")
                     break
@@ -608,7 +3334,8 @@ def main_menu():
         print("3. JOGAR contra o agente treinado")
         print("4. Q-Learning vs Minimax")
         print("5. Estatísticas de treinamento")
-        print("6. Sair")
+        print("6. Gerar livro de aberturas do Minimax")
+        print("7. Sair")
         print("="*40)
 
         choice = input("👉 Sua escolha: ").strip()
@@ -618,6 +3345,7 @@ def main_menu():
             episodes_to_train = int(input("Número de episódios de treinamento para este ciclo: "))
             # Inicializa um novo agente para começar do zero
             agent = QLearningAgent(ALPHA, GAMMA, EPSILON_START)
+            agent.start_checkpointing(Q_TABLE_FILE) # Salvamento incremental em segundo plano
             # Passa o número de episódios para a função de treinamento
             train_against_minimax(agent, episodes_to_train)
             agent.training_mode = False
@@ -626,11 +3354,12 @@ def main_menu():
             print("❌ Entrada inválida. Digite um número.")
 
         elif choice == "2":
-            if agent.load(PICKLE_FILE):
+            if agent.load(Q_TABLE_FILE):
                 agent_loaded = True
                 try:
                     episodes_to_train = int(input("Episódios adicionais para continuar o treinamento: "))
                     agent.training_mode = True
+                    agent.start_checkpointing(Q_TABLE_FILE) # Salvamento incremental em segundo plano
                     # Passa o número de episódios para a função de treinamento
                     train_against_minimax(agent, episodes_to_train)
                     agent.training_mode = False # Desativa modo de treino após concluir
@@ -641,7 +3370,7 @@ def main_menu():
 
         elif choice == "3":
             if not agent_loaded:
-                if agent.load(PICKLE_FILE):
+                if agent.load(Q_TABLE_FILE, mmap=True):
                     agent_loaded = True
                     # Garante que o agente não está em modo de treinamento para jogar
                     agent.training_mode = False
@@ -652,7 +3381,7 @@ def main_menu():
 
         elif choice == "4":
             if not agent_loaded:
-                if agent.load(PICKLE_FILE):
+                if agent.load(Q_TABLE_FILE, mmap=True):
                     agent_loaded = True
                     agent.training_mode = False
                 else:
@@ -681,6 +3410,15 @@ def main_menu():
                 print("⚠️ Nenhum agente carregado. Treine ou carregue um agente para ver as estatísticas.")
 
         elif choice == "6":
+            try:
+                plies = int(input(f"Plies de abertura a cobrir [{OPENING_BOOK_PLIES}]: ") or OPENING_BOOK_PLIES)
+                build_opening_book(OPENING_BOOK_FILE, plies)
+                mismatches = verify_opening_book(load_opening_book(), sample=200)
+                print(f"🔎 Conferência com busca sem cache (amostra de 200): {len(mismatches)} divergências")
+            except ValueError:
+                print("❌ Entrada inválida. Digite um número.")
+
+        elif choice == "7":
             print("\n✅ Programa encerrado. Até logo!")
             # Garante que a thread de salvamento assíncrono é parada
             if agent:
@@ -690,5 +3428,244 @@ def main_menu():
         else:
             print("❌ Opção inválida. Tente novamente.")
 
+# Linha de comando (sem menu), para execuções em lote: sem argumentos o
+# programa abre o menu interativo de sempre. A Q-table só é carregada pelos
+# subcomandos que precisam dela.
+
+def _cli_load_tablebase(filename):
+    # Tabela de --tablebase (None sem a opção), ou False se o arquivo não existir
+    if not filename:
+        return None
+    tablebase = load_tablebase(filename)
+    if tablebase is None:
+        log_event("⚠️ Arquivo não encontrado", 'file_not_found', file=filename)
+        return False
+    return tablebase
+
+def _cli_train(args):
+    global EPSILON_START, EPSILON_MIN, EPSILON_DECAY, MINIMAX_WORKERS
+    EPSILON_START, EPSILON_MIN, EPSILON_DECAY = args.epsilon_start, args.epsilon_min, args.epsilon_decay
+    MINIMAX_WORKERS = args.minimax_workers
+    if args.adaptive:
+        curriculum = AdaptiveCurriculum(tuple(int(d) for d in args.depths.split(',')), args.window,
+                                        args.promote, args.demote, args.mix, args.seed or 0)
+    else:
+        curriculum = parse_curriculum(args.curriculum) if args.curriculum else None
+    tablebase = _cli_load_tablebase(args.tablebase)
+    if tablebase is False:
+        return 1
+    if args.seed is not None:
+        random.seed(args.seed)
+    agent = QLearningAgent(args.alpha, args.gamma, EPSILON_START, args.policy, symmetry=args.symmetry,
+                           tablebase=tablebase)
+    if not args.new and os.path.exists(args.checkpoint):
+        agent.load(args.checkpoint)
+        agent.training_mode = True
+    replay = None
+    if args.replay:
+        replay = ReplayBuffer(args.replay, agent.symmetry, args.prioritized, seed=args.seed or 0,
+                              batch_size=args.replay_batch, ratio=args.replay_ratio)
+    if args.instrument:
+        INSTRUMENTATION.enable()
+    try:
+        if args.workers > 1:
+            train_parallel(agent, args.episodes, args.mode, args.workers, args.seed or 0,
+                           q_file=args.checkpoint, curriculum=curriculum, replay=replay)
+        else:
+            agent.start_checkpointing(args.checkpoint)
+            if args.mode == 'minimax':
+                train_against_minimax(agent, args.episodes, q_file=args.checkpoint, curriculum=curriculum, replay=replay)
+            else:
+                train_agent(agent, args.episodes, q_file=args.checkpoint)
+    finally:
+        agent.stop()
+        if args.instrument:
+            INSTRUMENTATION.disable()
+            INSTRUMENTATION.export_json(args.instrument, agent)
+    return 0
+
+def _cli_player(args):
+    # Agente das pretas de evaluate/play; None se a Q-table necessária não existir
+    q_agent = None
+    if args.agent == 'q' or args.priors:
+        q_agent = QLearningAgent(ALPHA, GAMMA, 0.0, saver=False)
+        if not q_agent.load(args.q_table, mmap=True):
+            return None
+        q_agent.training_mode = False
+    if args.agent == 'q':
+        return q_agent
+    if args.agent == 'minimax':
+        return MinimaxAgent(args.depth, time_ms=args.time_ms, book=None if args.time_ms else load_opening_book())
+    return MCTSAgent(args.playouts, args.time_ms, q_agent=q_agent, workers=args.mcts_workers, seed=args.seed)
+
+def _cli_evaluate(args):
+    tablebase = _cli_load_tablebase(args.tablebase)
+    if tablebase is False:
+        return 1
+    agent = _cli_player(args)
+    if agent is None:
+        return 1
+    opponent = None
+    if tablebase is not None or args.minimax_workers > 1:
+        opponent = MinimaxAgent(args.depth, book=load_opening_book(), workers=args.minimax_workers,
+                                tablebase=tablebase)
+    res = evaluate(agent, args.games, args.workers, args.seed, details=bool(args.output), minimax_depth=args.depth,
+                   opponent=opponent)
+    if isinstance(agent, MCTSAgent):
+        agent.close()
+    if opponent is not None:
+        opponent.close()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=2)
+    return 0
+
+def _cli_play(args):
+    agent = _cli_player(args)
+    if agent is None:
+        return 1
+    play_vs_agent(agent, ponder=not args.no_ponder)
+    if isinstance(agent, MCTSAgent):
+        agent.close()
+    return 0
+
+def _cli_convert(args):
+    entries = convert_q_table(args.src, args.dst)
+    log_event(f"💾 Convertido: {entries} Q-entradas em {args.dst}", 'converted', src=args.src, dst=args.dst, entries=entries)
+    return 0
+
+def _cli_book(args):
+    depths = tuple(int(d) for d in args.depths.split(','))
+    book = build_opening_book(args.output, args.plies, depths)
+    if args.verify:
+        mismatches = verify_opening_book(book, sample=args.verify)
+        log_event(f"🔎 Conferência com busca sem cache (amostra de {args.verify}): {len(mismatches)} divergências",
+                  'book_verified', sample=args.verify, mismatches=len(mismatches))
+        return 1 if mismatches else 0
+    return 0
+
+def _cli_tablebase(args):
+    tb = build_tablebase(args.output, args.plies, args.games, args.tail, args.seed)
+    if args.verify:
+        mismatches, checked = verify_tablebase(tb, args.verify, args.tail, args.seed + 1)
+        log_event(f"🔎 Conferência com Minimax sem tabela ({checked} posições de {args.verify} partidas novas): "
+                  f"{len(mismatches)} divergências", 'tablebase_verified', checked=checked, mismatches=len(mismatches))
+        return 1 if mismatches else 0
+    return 0
+
+def _cli_benchmark(args, extra):
+    import benchmark_kamisado
+    return benchmark_kamisado.main(extra)
+
+def _cli_perft(args, extra):
+    import perft_kamisado
+    return perft_kamisado.main(extra)
+
+def cli(argv=None):
+    global LOG_FORMAT
+    parser = argparse.ArgumentParser(description="Kamisado - aprendizado por reforço (linha de comando)")
+    parser.add_argument('--log-format', choices=('text', 'json'), default=LOG_FORMAT,
+                        help="json: uma linha JSON por evento de progresso")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="treina o Q-Agent contra o Minimax ou por self-play")
+    train.add_argument('--mode', choices=('minimax', 'self'), default='minimax')
+    train.add_argument('--episodes', type=int, default=EPISODES)
+    train.add_argument('--new', action='store_true', help="começa do zero em vez de continuar o checkpoint")
+    train.add_argument('--checkpoint', default=Q_TABLE_FILE, help="arquivo da Q-table (lido e gravado)")
+    train.add_argument('--alpha', type=float, default=ALPHA)
+    train.add_argument('--gamma', type=float, default=GAMMA)
+    train.add_argument('--epsilon-start', type=float, default=EPSILON_START)
+    train.add_argument('--epsilon-min', type=float, default=EPSILON_MIN)
+    train.add_argument('--epsilon-decay', type=float, default=EPSILON_DECAY)
+    train.add_argument('--policy', choices=('epsilon-greedy', 'softmax'), default=EXPLORATION_POLICY)
+    train.add_argument('--symmetry', action='store_true', help="compartilha valores entre posições espelhadas")
+    train.add_argument('--curriculum', help="profundidades do Minimax por episódio, ex.: 0:1,3000:2,8000:3")
+    train.add_argument('--adaptive', action='store_true',
+                       help="currículo adaptativo: sobe a profundidade pela taxa de vitórias recente")
+    train.add_argument('--depths', default='1,2,3', help="com --adaptive: profundidades, em ordem")
+    train.add_argument('--window', type=int, default=200, help="com --adaptive: partidas da taxa de vitórias")
+    train.add_argument('--promote', type=float, default=0.5, help="com --adaptive: taxa para subir de profundidade")
+    train.add_argument('--demote', type=float, help="com --adaptive: taxa abaixo da qual volta uma profundidade")
+    train.add_argument('--mix', type=float, default=0.0,
+                       help="com --adaptive: fração de episódios contra profundidades já superadas")
+    train.add_argument('--replay', type=int, default=0, metavar='N',
+                       help="contra o Minimax: aprende de um replay buffer com N transições")
+    train.add_argument('--replay-batch', type=int, default=REPLAY_BATCH)
+    train.add_argument('--replay-ratio', type=float, default=REPLAY_RATIO,
+                       help="vezes que cada transição nova é sorteada, na média")
+    train.add_argument('--prioritized', action='store_true', help="sorteio do replay pelo erro TD")
+    train.add_argument('--tablebase', metavar='KTB',
+                       help="tabela de finais: reforça a recompensa e o Minimax joga os finais com exatidão")
+    train.add_argument('--workers', type=int, default=1)
+    train.add_argument('--minimax-workers', type=int, default=1,
+                       help="com --workers 1: processos da busca do Minimax (paralela pela raiz)")
+    train.add_argument('--seed', type=int)
+    train.add_argument('--instrument', metavar='JSON', help="mede o treino e grava o relatório neste arquivo")
+    train.set_defaults(func=_cli_train)
+
+    ev = commands.add_parser('evaluate', help="partidas do Q-Agent contra o Minimax")
+    ev.add_argument('--games', type=int, default=50)
+    ev.add_argument('--depth', type=int, default=3, help="profundidade do Minimax")
+    ev.add_argument('--workers', type=int, default=1)
+    ev.add_argument('--minimax-workers', type=int, default=1,
+                    help="com --workers 1: processos da busca do Minimax (paralela pela raiz)")
+    ev.add_argument('--seed', type=int)
+    ev.add_argument('--output', help="grava o resultado de cada partida neste arquivo JSON")
+    ev.add_argument('--tablebase', metavar='KTB', help="o Minimax consulta esta tabela de finais")
+    ev.set_defaults(func=_cli_evaluate)
+
+    play = commands.add_parser('play', help="partida de um humano (brancas) contra o agente")
+    play.add_argument('--seed', type=int)
+    play.add_argument('--agent', choices=('q', 'mcts', 'minimax'), default='q', help="agente das pretas")
+    play.add_argument('--depth', type=int, default=5, help="Minimax: profundidade da busca")
+    play.add_argument('--no-ponder', action='store_true', help="não calcula as respostas enquanto o humano pensa")
+    play.set_defaults(func=_cli_play)
+    ev.add_argument('--agent', choices=('q', 'mcts'), default='q', help="agente das pretas")
+
+    for sub in (ev, play):
+        sub.add_argument('--q-table', default=Q_TABLE_FILE)
+        sub.add_argument('--playouts', type=int, default=MCTS_PLAYOUTS, help="MCTS: simulações por jogada")
+        sub.add_argument('--time-ms', type=float, help="MCTS/Minimax: tempo por jogada (no lugar de --playouts/--depth)")
+        sub.add_argument('--priors', action='store_true', help="MCTS: prioridades da Q-table de --q-table")
+        sub.add_argument('--mcts-workers', type=int, default=1, help="MCTS: processos por busca")
+
+    convert = commands.add_parser('convert', help="converte uma Q-table pickle antiga para o formato binário")
+    convert.add_argument('src', nargs='?', default=PICKLE_FILE)
+    convert.add_argument('dst', nargs='?', default=Q_TABLE_FILE)
+    convert.set_defaults(func=_cli_convert)
+
+    book = commands.add_parser('book', help="gera o livro de aberturas do Minimax")
+    book.add_argument('--plies', type=int, default=OPENING_BOOK_PLIES)
+    book.add_argument('--depths', default='1,2,3')
+    book.add_argument('--output', default=OPENING_BOOK_FILE)
+    book.add_argument('--verify', type=int, default=0, metavar='N', help="confere N entradas com busca sem cache")
+    book.set_defaults(func=_cli_book)
+
+    tb = commands.add_parser('tablebase', help="gera a tabela de finais resolvidos")
+    tb.add_argument('--plies', type=int, default=TABLEBASE_PLIES, help="distância máxima resolvida")
+    tb.add_argument('--games', type=int, default=2000, help="partidas aleatórias de onde vêm as posições")
+    tb.add_argument('--tail', type=int, default=6, help="últimos plies de cada partida (e os seus filhos)")
+    tb.add_argument('--seed', type=int, default=0)
+    tb.add_argument('--output', default=TABLEBASE_FILE)
+    tb.add_argument('--verify', type=int, default=0, metavar='N',
+                    help="confere com o Minimax sem tabela as posições de N partidas novas")
+    tb.set_defaults(func=_cli_tablebase)
+
+    for name, func, help_text in (('benchmark', _cli_benchmark, "benchmark_kamisado.py (argumentos repassados)"),
+                                  ('perft', _cli_perft, "perft_kamisado.py (argumentos repassados)")):
+        sub = commands.add_parser(name, help=help_text, add_help=False)
+        sub.set_defaults(func=func, passthrough=True)
+
+    args, extra = parser.parse_known_args(argv)
+    LOG_FORMAT = args.log_format
+    if getattr(args, 'passthrough', False):
+        return args.func(args, extra)
+    if extra:
+        parser.error(f"argumentos não reconhecidos: {' '.join(extra)}")
+    return args.func(args)
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(cli())
     main_menu()
\ No newline at end of file
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Perft do Kamisado: conta as folhas da árvore de movimentos até a profundidade N
+# e confere com as contagens de referência do corpus (perft_corpus.json).
+#
+# Uso:
+#   python perft_kamisado.py                       # confere todo o corpus
+#   python perft_kamisado.py --max-depth 3         # só até a profundidade 3
+#   python perft_kamisado.py --engine position     # usa o Position (make/unmake)
+#   python perft_kamisado.py --position inicial-brancas --depth 3 --divide
+#
+# Uma posição terminal (game_over) não tem filhos: ela só conta como folha na
+# profundidade 0. Sai com código 1 se alguma contagem não bater com a referência.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import ep3_kamisado_entrega as kam
+
+PERFT_CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perft_corpus.json')
+
+def perft(state, depth, successors=kam.successors):
+    # Versão com os estados em dicionário (successors/game_over)
+    if depth == 0:
+        return 1
+    if kam.game_over(state):
+        return 0
+    children = successors(state)
+    if depth == 1:
+        return len(children)
+    return sum(perft(child, depth - 1, successors) for child in children)
+
+def perft_position(pos, depth):
+    # Mesma contagem sobre o Position, com make_move/unmake_move
+    if depth == 0:
+        return 1
+    if pos.winner():
+        return 0
+    moves = pos.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = pos.make_move(move)
+        nodes += perft_position(pos, depth - 1)
+        pos.unmake_move(move, undo)
+    return nodes
+
+def divide(state, depth, engine='dict'):
+    # Contagem por movimento da raiz: [(movimento (peça, origem, destino), folhas)]
+    pos = kam.Position.from_dict(state)
+    result = []
+    if pos.winner():
+        return result
+    for move in pos.legal_moves():
+        if engine == 'position':
+            undo = pos.make_move(move)
+            result.append((move, perft_position(pos, depth - 1)))
+            pos.unmake_move(move, undo)
+        else:
+            result.append((move, perft(pos.child_dict(move), depth - 1)))
+    return result
+
+def state_from_json(data):
+    state = dict(data)
+    for side in ('white', 'black'):
+        state[side] = {lbl: tuple(sq) for lbl, sq in data[side].items()}
+    return state
+
+def state_to_json(state):
+    return {key: state[key] for key in ('white', 'black', 'turn', 'next_color', 'no_progress')}
+
+def load_corpus(filename=PERFT_CORPUS_FILE):
+    with open(filename) as f:
+        corpus = json.load(f)
+    for entry in corpus['positions']:
+        entry['state'] = state_from_json(entry['state'])
+    return corpus
+
+def run_perft(state, depth, engine='dict'):
+    # (folhas, segundos)
+    start = time.perf_counter()
+    if engine == 'position':
+        nodes = perft_position(kam.Position.from_dict(state), depth)
+    else:
+        nodes = perft(state, depth)
+    return nodes, time.perf_counter() - start
+
+def check_corpus(corpus, engine='dict', max_depth=None, names=None):
+    # Confere cada (posição, profundidade) do corpus; devolve (linhas, divergências)
+    rows, mismatches = [], 0
+    for entry in corpus['positions']:
+        if names and entry['name'] not in names:
+            continue
+        for depth, expected in sorted((int(d), n) for d, n in entry['counts'].items()):
+            if max_depth is not None and depth > max_depth:
+                continue
+            nodes, elapsed = run_perft(entry['state'], depth, engine)
+            ok = nodes == expected
+            mismatches += not ok
+            rows.append({'position': entry['name'], 'depth': depth, 'nodes': nodes, 'expected': expected,
+                         'ok': ok, 'seconds': elapsed, 'nodes_per_sec': nodes / elapsed if elapsed else 0.0})
+    return rows, mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft do Kamisado")
+    parser.add_argument('--corpus', default=PERFT_CORPUS_FILE)
+    parser.add_argument('--engine', choices=('dict', 'position'), default='dict',
+                        help="dict: successors()/game_over(); position: Position.legal_moves()")
+    parser.add_argument('--max-depth', type=int, help="ignora as referências mais profundas")
+    parser.add_argument('--position', action='append', help="só as posições com este nome (pode repetir)")
+    parser.add_argument('--depth', type=int, help="com --position: calcula só esta profundidade")
+    parser.add_argument('--divide', action='store_true', help="com --depth: contagem por movimento da raiz")
+    parser.add_argument('--json', help="grava os resultados neste arquivo JSON")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    if args.depth is not None:
+        # Contagem avulsa, sem referência
+        for entry in corpus['positions']:
+            if args.position and entry['name'] not in args.position:
+                continue
+            if args.divide:
+                for move, nodes in divide(entry['state'], args.depth, args.engine):
+                    print(f"{move}: {nodes}")
+            nodes, elapsed = run_perft(entry['state'], args.depth, args.engine)
+            print(f"{entry['name']} perft({args.depth}) = {nodes} ({nodes / max(elapsed, 1e-9):,.0f} nós/s)")
+        return 0
+
+    rows, mismatches = check_corpus(corpus, args.engine, args.max_depth, args.position)
+    total_nodes = sum(row['nodes'] for row in rows)
+    total_time = sum(row['seconds'] for row in rows)
+    for row in rows:
+        status = '✅' if row['ok'] else f"❌ esperado {row['expected']}"
+        print(f"{row['position']:28s} d={row['depth']} {row['nodes']:>10} {row['nodes_per_sec']:>12,.0f} nós/s {status}")
+    print(f"Total: {total_nodes} nós em {total_time:.2f}s ({total_nodes / max(total_time, 1e-9):,.0f} nós/s), "
+          f"{mismatches} divergência(s)")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'engine': args.engine, 'rows': rows, 'mismatches': mismatches,
+                       'nodes': total_nodes, 'seconds': total_time}, f, indent=2)
+    return 1 if mismatches else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ep3_kamisado_entrega as kam
+
+def random_game_states(n_games=60, seed=2024):
+    # Estados não terminais de partidas aleatórias (fixas pela semente), com
+    # metade das partidas começando por cada lado
+    rng = random.Random(seed)
+    states = []
+    for i in range(n_games):
+        state = kam.initial_state()
+        state['turn'] = 'black' if i % 2 else 'white'
+        while not kam.game_over(state):
+            moves = kam.successors(state)
+            if not moves:
+                break
+            states.append(state)
+            state = rng.choice(moves)
+    return states
+
+@pytest.fixture(scope='session')
+def game_states():
+    return random_game_states()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# A heurística sobre o Position (mobilidade contada sem gerar os filhos,
+# progresso e centro somados incrementalmente) tem de dar exatamente os valores
+# da versão original em dicionário, para que as Q-tables já treinadas continuem
+# comparáveis.
+
+import ep3_kamisado_entrega as kam
+
+def original_mobility(state):
+    # Número de sucessores como no successors() original, sem montar os estados
+    current = state['turn']
+    occupied = set(state['white'].values()) | set(state['black'].values())
+    dirs = [(-1, -1), (-1, 0), (-1, 1)] if current == 'white' else [(1, -1), (1, 0), (1, 1)]
+    count = 0
+    for r0, c0 in state[current].values():
+        if state['next_color'] and kam.board[r0, c0] != state['next_color']:
+            continue
+        for dr, dc in dirs:
+            step = 1
+            while True:
+                r, c = r0 + dr * step, c0 + dc * step
+                if not (0 <= r < 8 and 0 <= c < 8) or (r, c) in occupied:
+                    break
+                count += 1
+                step += 1
+    return count
+
+def original_heuristic(state):
+    black_progress = sum(7 - pos[0] for pos in state['black'].values()) * 25
+    white_progress = sum(pos[0] for pos in state['white'].values()) * 30
+    progress = black_progress - white_progress
+
+    center_control = 0
+    for pos in [(3, 3), (3, 4), (4, 3), (4, 4)]:
+        if pos in state['black'].values():
+            center_control += 50
+        elif pos in state['white'].values():
+            center_control -= 40
+
+    mobility = original_mobility(state)
+    if state['turn'] == 'black':
+        mobility *= 10
+    else:
+        mobility *= -8
+    return int(progress * 0.5 + center_control * 0.3 + mobility * 0.2)
+
+def test_mobility_count_matches_successors(game_states):
+    for state in game_states:
+        assert kam.Position.from_dict(state).count_moves() == original_mobility(state) == len(kam.successors(state))
+
+def test_heuristic_matches_original_for_each_side_to_move(game_states):
+    for state in game_states:
+        for turn in ('white', 'black'):
+            flipped = dict(state, turn=turn)
+            assert kam.advanced_heuristic(flipped) == original_heuristic(flipped)
+
+def test_incremental_terms_follow_make_and_unmake(game_states):
+    # Os termos somados pelo make_move/unmake_move batem com os recalculados do zero
+    for state in game_states[::5]:
+        pos = kam.Position.from_dict(state)
+        before = (pos.progress, pos.center, kam.position_heuristic(pos))
+        for move in pos.legal_moves():
+            undo = pos.make_move(move)
+            fresh = kam.Position.from_dict(pos.to_dict())
+            assert (pos.progress, pos.center) == (fresh.progress, fresh.center)
+            assert kam.position_heuristic(pos) == original_heuristic(pos.to_dict())
+            pos.unmake_move(move, undo)
+        assert (pos.progress, pos.center, kam.position_heuristic(pos)) == before
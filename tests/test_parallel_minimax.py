@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# A busca paralela pela raiz tem de escolher o mesmo movimento, com o mesmo
+# valor, que a busca serial de um agente zerado.
+
+import pytest
+
+import ep3_kamisado_entrega as kam
+
+@pytest.mark.parametrize('depth, ordering', [(2, True), (3, True), (3, False), (4, True)])
+def test_parallel_search_matches_fresh_serial_search(game_states, depth, ordering):
+    parallel = kam.MinimaxAgent(depth, ordering=ordering, workers=2)
+    try:
+        for state in game_states[::12]:
+            pos = kam.Position.from_dict(state)
+            serial_value, serial_move, _ = kam.MinimaxAgent(depth, ordering=ordering).search_position(pos)
+            value, move, ctx = parallel.search_position(pos)
+            assert (value, move) == (serial_value, serial_move)
+            assert ctx.nodes > 0
+    finally:
+        parallel.close()
+
+def test_parallel_search_with_tablebase(tmp_path, game_states):
+    tablebase = kam.build_tablebase(str(tmp_path / 'tb.ktb'), 3, games=20, seed=1)
+    parallel = kam.MinimaxAgent(3, workers=2, tablebase=tablebase)
+    try:
+        for state in game_states[::12]:
+            pos = kam.Position.from_dict(state)
+            expected = kam.MinimaxAgent(3, tablebase=tablebase).search_position(pos)[:2]
+            assert parallel.search_position(pos)[:2] == expected
+    finally:
+        parallel.close()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Q-table em tabela hash: crescimento com o rastreamento de alterações ligado,
+# arquivo binário (.kqt), mmap e recuperação do log de checkpoint (WAL).
+
+import numpy as np
+
+import ep3_kamisado_entrega as kam
+
+def random_entries(n, seed=0):
+    rng = np.random.default_rng(seed)
+    w = rng.integers(1, 1 << 63, n, dtype=np.uint64)
+    b = rng.integers(1, 1 << 63, n, dtype=np.uint64)
+    x = rng.integers(0, 1 << 17, n, dtype=np.uint32)
+    return w, b, x, rng.random(n)
+
+def table_dict(table):
+    return dict(table.items())
+
+def new_agent():
+    return kam.QLearningAgent(kam.ALPHA, kam.GAMMA, 0.1, saver=False)
+
+def test_checkpointed_table_grows_and_recovers(tmp_path):
+    # Tabela pequena com o checkpoint ligado: várias realocações, tanto por
+    # __setitem__ quanto por set_many, antes do log e da recuperação
+    fn = str(tmp_path / 'q.kqt')
+    agent = new_agent()
+    agent.q_table = kam.QTable(16)
+    agent.start_checkpointing(fn)
+    w, b, x, v = random_entries(3000)
+    for key in zip(w[:1000].tolist(), b[:1000].tolist(), x[:1000].tolist()):
+        agent.q_table[key] = 0.5
+    agent.q_table.set_many(w[1000:], b[1000:], x[1000:], v[1000:])
+    assert agent.q_table.capacity >= 4096
+    agent._flush_wal() # "Queda" logo depois: o snapshot é o vazio de start_checkpointing
+
+    expected = table_dict(agent.q_table)
+    assert len(expected) == 3000
+    loaded = new_agent()
+    assert loaded.load(fn)
+    assert table_dict(loaded.q_table) == expected
+
+def test_save_and_load_binary_file(tmp_path):
+    fn = str(tmp_path / 'q.kqt')
+    agent = new_agent()
+    agent.q_table = kam.QTable.from_arrays(*random_entries(500, seed=1))
+    agent.stats['wins'] = 7
+    agent.save(fn)
+    assert kam.is_q_table_file(fn)
+    for mmap in (False, True):
+        loaded = new_agent()
+        assert loaded.load(fn, mmap=mmap)
+        assert table_dict(loaded.q_table) == table_dict(agent.q_table)
+        assert loaded.stats['wins'] == 7
+    # A tabela mapeada aceita escritas (cópia na escrita) sem alterar o arquivo
+    loaded.q_table[(1, 2, 3)] = 9.0
+    again = new_agent()
+    again.load(fn, mmap=True)
+    assert (1, 2, 3) not in again.q_table
+
+def test_wal_replay_and_stale_wal(tmp_path):
+    fn = str(tmp_path / 'q.kqt')
+    agent = new_agent()
+    agent.q_table[(1, 2, 3)] = 1.0
+    agent.start_checkpointing(fn)
+    agent.q_table[(1, 2, 3)] = 2.0
+    agent.q_table[(4, 5, 6)] = 3.0
+    agent.stats['wins'] = 10
+    agent._flush_wal()
+
+    recovered = new_agent()
+    recovered.load(fn)
+    assert recovered.q_table[(1, 2, 3)] == 2.0 and recovered.q_table[(4, 5, 6)] == 3.0
+    assert recovered.stats['wins'] == 10
+
+    # Um snapshot gravado sem checkpoint não pode ser sobrescrito pelo log antigo
+    recovered.q_table[(1, 2, 3)] = 99.0
+    recovered.stats['wins'] = 500
+    recovered.save(fn)
+    reloaded = new_agent()
+    reloaded.load(fn)
+    assert reloaded.q_table[(1, 2, 3)] == 99.0 and reloaded.stats['wins'] == 500
+
+def test_truncated_wal_record_is_ignored(tmp_path):
+    fn = str(tmp_path / 'q.kqt')
+    agent = new_agent()
+    agent.start_checkpointing(fn)
+    agent.q_table[(1, 2, 3)] = 1.0
+    agent._flush_wal()
+    agent.q_table[(4, 5, 6)] = 2.0
+    agent._flush_wal()
+    with open(fn + '.wal', 'r+b') as f: # Queda no meio do segundo registro
+        f.truncate(f.seek(0, 2) - 5)
+    loaded = new_agent()
+    loaded.load(fn)
+    assert loaded.q_table[(1, 2, 3)] == 1.0 and (4, 5, 6) not in loaded.q_table
+
+def legacy_table(states):
+    # Q-table antiga: {(encode_state(s), encode_state(a)): q} e os mesmos
+    # valores pelas chaves novas (estado, código da ação)
+    legacy, expected = {}, {}
+    for i, state in enumerate(states):
+        for j, action in enumerate(kam.successors(state)[:3]):
+            q = i + j / 10
+            legacy[(kam.encode_state(state), kam.encode_state(action))] = q
+            expected[(kam.encode_state_key(state), kam.action_code(state, action))] = q
+    return legacy, expected
+
+def test_legacy_pickle_import(tmp_path, game_states):
+    legacy, expected = legacy_table(game_states[:40])
+    # Um par que não é o movimento de uma única peça é descartado
+    start = kam.initial_state()
+    legacy[(kam.encode_state(start), kam.encode_state(start))] = 5.0
+    pkl = str(tmp_path / 'q.pkl')
+    with open(pkl, 'wb') as f:
+        kam.pickle.dump({'q_table': legacy, 'stats': {'wins': 3, 'losses': 0, 'draws': 0, 'total_rewards': 0},
+                         'epsilon': 0.2}, f)
+
+    # load() do .kqt ausente cai no .pkl de mesmo nome
+    agent = new_agent()
+    assert agent.load(str(tmp_path / 'q.kqt'))
+    assert len(agent.q_table) == len(expected)
+    assert agent.stats['wins'] == 3 and agent.epsilon == 0.2
+    for (s_key, code), q in expected.items():
+        assert agent.get_q(s_key, code) == q
+
+    kqt = str(tmp_path / 'convertido.kqt')
+    assert kam.convert_q_table(pkl, kqt) == len(expected)
+    converted = new_agent()
+    converted.load(kqt, mmap=True)
+    assert table_dict(converted.q_table) == table_dict(agent.q_table)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# A simetria de espelhamento (c -> 7 - c com as cores trocadas por
+# COLOR_MIRROR) conferida contra o próprio board: a posição espelhada tem os
+# mesmos movimentos (espelhados), a mesma heurística e as chaves de hash e da
+# Q-table coerentes com as da original.
+
+import ep3_kamisado_entrega as kam
+
+def mirror_state(state):
+    mirrored = dict(state)
+    for side in ('white', 'black'):
+        mirrored[side] = {lbl: (r, 7 - c) for lbl, (r, c) in state[side].items()}
+    color = kam.COLOR_TO_INT.get(state['next_color'], kam.NO_COLOR)
+    mirrored['next_color'] = kam.INT_TO_COLOR.get(kam.mirror_color(color))
+    return mirrored
+
+def mirror_move(move):
+    piece, frm, to = move
+    return (piece, frm ^ 7, to ^ 7)
+
+def test_color_mirror_matches_board():
+    assert kam.COLOR_MIRROR is not None
+    assert sorted(kam.COLOR_MIRROR) == list(range(len(kam.COLOR_TO_INT)))
+    for color, mirrored in enumerate(kam.COLOR_MIRROR):
+        assert kam.COLOR_MIRROR[mirrored] == color
+    for r in range(8):
+        for c in range(8):
+            mirrored = kam.INT_TO_COLOR[kam.COLOR_MIRROR[kam.COLOR_TO_INT[kam.board[r, c]]]]
+            assert kam.board[r, 7 - c] == mirrored
+            assert kam.SQUARE_COLOR[kam.MIRROR_SQUARE[r*8 + c]] == kam.COLOR_MIRROR[kam.SQUARE_COLOR[r*8 + c]]
+
+def test_mirrored_positions_have_mirrored_moves_and_same_heuristic(game_states):
+    for state in game_states:
+        mirrored = mirror_state(state)
+        assert mirror_state(mirrored) == state
+        pos, mpos = kam.Position.from_dict(state), kam.Position.from_dict(mirrored)
+        assert sorted(mirror_move(move) for move in pos.legal_moves()) == sorted(mpos.legal_moves())
+        assert kam.advanced_heuristic(mirrored) == kam.advanced_heuristic(state)
+        assert kam.game_over(mirrored) == kam.game_over(state)
+
+def test_hashes_and_q_keys_agree_across_the_mirror(game_states):
+    for state in game_states:
+        pos, mpos = kam.Position.from_dict(state), kam.Position.from_dict(mirror_state(state))
+        assert mpos.hash == pos.mirror_hash and mpos.mirror_hash == pos.hash
+        s_key, m_key = kam.state_key(pos), kam.state_key(mpos)
+        assert kam.mirror_state_key(s_key) == m_key
+        assert kam.encode_state_key(mirror_state(state)) == m_key
+        for move in pos.legal_moves():
+            code = kam.move_code(move)
+            assert kam.move_code(mirror_move(move)) == code ^ kam.MIRROR_CODE
+            assert kam.canonical_q_key(s_key, code) == kam.canonical_q_key(m_key, code ^ kam.MIRROR_CODE)
+            # O mirror_hash atualizado no make_move é o do espelho recalculado
+            undo = pos.make_move(move)
+            assert pos.mirror_hash == pos.compute_hash(mirror=True)
+            pos.unmake_move(move, undo)